@@ -0,0 +1,234 @@
+import asyncio
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from colorama import Fore
+
+from console_log import get_logger
+
+MAX_HEADER_SIZE = 64 * 1024
+# Больше не нужно даже пакету из PUSH_BATCH_MAX записей; длину объявляет
+# клиент, поэтому без предела один запрос мог занять сколько угодно памяти
+MAX_BODY_SIZE = 2 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 75
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class AsyncWSGIServer:
+    """Минимальный HTTP/1.1 сервер на asyncio для Flask приложения.
+
+    Нужен для режима, в котором HTTP API, WebSocket сервер и Discord монитор
+    работают в одном event loop. Сами Flask обработчики синхронные (long-poll,
+    SSE), поэтому вызываются в пуле потоков; сокеты и разбор запросов
+    остаются в loop. Запросы, которые долго ждут событий (is_waiting(environ):
+    long-poll pull, SSE), идут в отдельный пул из wait_workers потоков, так
+    что push и /metrics не ждут свободного потока за ними; сверх
+    wait_workers ожидающие запросы встают в очередь своего пула.
+    """
+
+    def __init__(self, app, host, port, max_workers=64, wait_workers=64, is_waiting=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='http')
+        self.is_waiting = is_waiting
+        self.wait_executor = None
+        if is_waiting is not None:
+            self.wait_executor = ThreadPoolExecutor(max_workers=wait_workers,
+                                                    thread_name_prefix='http-wait')
+        self.server = None
+        self.console = get_logger('HTTP')
+
+    def log(self, message, color=Fore.WHITE, level=logging.INFO):
+        self.console.log(message, color, level)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection,
+                                                 self.host,
+                                                 self.port,
+                                                 limit=MAX_HEADER_SIZE)
+        self.log(f"🚀 HTTP API listening on http://{self.host}:{self.port}",
+                 Fore.GREEN)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_error(writer, '431 Request Header Fields Too Large')
+                    break
+
+                request = self.parse_head(head)
+                if request is None:
+                    await self.send_error(writer, '400 Bad Request')
+                    break
+                method, target, version, headers = request
+
+                try:
+                    body = await self.read_body(reader, writer, headers)
+                except BodyTooLarge:
+                    await self.send_error(writer, '413 Payload Too Large')
+                    break
+                if body is None:
+                    await self.send_error(writer, '400 Bad Request')
+                    break
+
+                keep_alive = (version == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                environ = self.build_environ(method, target, version, headers,
+                                             body, peer)
+                keep_alive = await self.run_app(environ, writer, keep_alive)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            self.log(f"❌ Error handling HTTP client {peer}: {e}", Fore.RED)
+        finally:
+            writer.close()
+
+    @staticmethod
+    def parse_head(head):
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    @staticmethod
+    async def read_body(reader, writer, headers):
+        """-> тело запроса, None для неверной длины; BodyTooLarge, если тело
+        больше MAX_BODY_SIZE"""
+        chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        if not chunked:
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                return None
+            if length > MAX_BODY_SIZE:
+                raise BodyTooLarge()
+        # 100 Continue только после проверки длины: лишнее тело клиент не пошлёт
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        if chunked:
+            chunks = []
+            received = 0
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                try:
+                    size = int(size_line.split(b';', 1)[0], 16)
+                except ValueError:
+                    return None
+                if size == 0:
+                    # Трейлеры не поддерживаем, дочитываем пустую строку
+                    await reader.readuntil(b'\r\n')
+                    return b''.join(chunks)
+                received += size
+                if received > MAX_BODY_SIZE:
+                    raise BodyTooLarge()
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+
+        if length <= 0:
+            return b''
+        return await reader.readexactly(length)
+
+    def build_environ(self, method, target, version, headers, body, peer):
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0] if peer else '',
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            if name in ('content-type', 'content-length'):
+                continue
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    def executor_for(self, environ):
+        if self.wait_executor is not None and self.is_waiting(environ):
+            return self.wait_executor
+        return self.executor
+
+    async def run_app(self, environ, writer, keep_alive):
+        loop = asyncio.get_running_loop()
+        executor = self.executor_for(environ)
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = response_headers
+            return lambda data: None
+
+        def call_app():
+            iterable = self.app(environ, start_response)
+            iterator = iter(iterable)
+            return iterable, iterator, next(iterator, None)
+
+        iterable, iterator, chunk = await loop.run_in_executor(
+            executor, call_app)
+        try:
+            headers = response['headers']
+            has_length = any(name.lower() == 'content-length'
+                             for name, _ in headers)
+            # Без Content-Length (SSE, стримы) тело заканчивается закрытием
+            keep_alive = keep_alive and has_length
+            head = [f"HTTP/1.1 {response['status']}"]
+            head.extend(f"{name}: {value}" for name, value in headers)
+            head.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+            while chunk is not None:
+                if chunk:
+                    writer.write(chunk)
+                    await writer.drain()
+                chunk = await loop.run_in_executor(executor, next,
+                                                   iterator, None)
+            await writer.drain()
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
+        return keep_alive
+
+    @staticmethod
+    async def send_error(writer, status):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1'))
+        await writer.drain()
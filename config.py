@@ -1,5 +1,6 @@
 import os
 import socket
+import tempfile
 
 def get_api_url():
     render_url = os.getenv("RENDER_EXTERNAL_URL")
@@ -30,7 +31,10 @@ def get_api_url():
 API_URL = get_api_url()
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN", "")
-DISCORD_RECONNECT_DELAY = 5
+DISCORD_GATEWAY_URL = os.getenv("DISCORD_GATEWAY_URL", "wss://gateway.discord.gg/?v=10&encoding=json")
+# Задержка переподключения: случайная в [0, min(MAX, DELAY * 2^(попытка-1))]
+DISCORD_RECONNECT_DELAY = 1
+DISCORD_RECONNECT_MAX_DELAY = 30
 
 MONITORED_CHANNELS = [
     "1266358579934269463",
@@ -41,6 +45,13 @@ MONITORED_CHANNELS = [
 LOG_RAW_MESSAGES = True
 LOG_PARSED_DATA = True
 LOG_FILTER_RESULTS = True
+# Вывод в консоль идёт через очередь в отдельном потоке; DEBUG включает
+# рамки и пошаговые сообщения для каждого Discord сообщения
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = 10000
+# Доля сообщений, для которых печатаются полный JSON, сырой разбор и
+# распарсенные поля (0.0 - выключено, 1.0 - каждое сообщение)
+LOG_DUMP_SAMPLE_RATE = float(os.getenv("LOG_DUMP_SAMPLE_RATE", "0"))
 
 PAUSE_HOTKEY = 'f9'
 
@@ -51,10 +62,32 @@ JOB_ID_PATTERNS = ['Job ID', 'JobID', 'job_id']
 SCRIPT_PATTERNS = ['Script', 'Join Script', 'script']
 JOIN_LINK_PATTERNS = ['Join Link', 'Link', 'join_link']
 
+# Повторы одного уведомления (пересылки в несколько каналов) берутся из кэша
+# разбора: не больше PARSE_CACHE_SIZE записей, каждая живёт PARSE_CACHE_TTL секунд
+PARSE_CACHE_SIZE = 512
+PARSE_CACHE_TTL = 30
+
+# Сигнатуры источников для роутера парсеров (message_parser.ROUTER): сообщение
+# уходит первому парсеру, у которого совпал автор, канал или начало текста.
+# Всё остальное разбирается общим каскадом форматов
+SOURCE_SIGNATURES = {
+    'ice_hub': {
+        'author_ids': [],
+        'channel_ids': [],
+        'prefixes': ['Ice Hub Finder - Target Located']
+    },
+    'chilli_hub': {
+        'author_ids': [],
+        'channel_ids': [],
+        'prefixes': ['Brainrot Notify']
+    }
+}
+
+# Вторая группа - единица: K делится на 1000, B умножается (деньги в M/s)
 MONEY_PATTERNS = [
-    r'(\d+(?:\.\d+)?)\s*M',
-    r'(\d+(?:\.\d+)?)\s*K',
-    r'(\d+(?:\.\d+)?)\s*B'
+    r'(\d+(?:\.\d+)?)\s*(M)',
+    r'(\d+(?:\.\d+)?)\s*(K)',
+    r'(\d+(?:\.\d+)?)\s*(B)'
 ]
 
 ICE_HUB_FILTER = {
@@ -82,8 +115,54 @@ FILTER_BY_NAME = {
 
 BYPASS_10M = True
 
+# Файл с переопределениями настроек выше (MONITORED_CHANNELS, фильтры):
+# изменения подхватываются без перезапуска, см. runtime_config.py
+RUNTIME_CONFIG_FILE = os.getenv("RUNTIME_CONFIG_FILE", "runtime_config.json")
+RUNTIME_CONFIG_POLL = 2
+# Общий секрет для POST /api/config (заголовок X-Config-Token); пока он не
+# задан, менять настройки через API нельзя - только через файл выше
+CONFIG_API_TOKEN = os.getenv("CONFIG_API_TOKEN", "")
+
 WEBSOCKET_HOST = '0.0.0.0'
 WEBSOCKET_PORT = 8765
+# Откуда HTTP API берёт клиентов отдельно запущенного websocket_server.py
+# (GET /clients на его порту)
+WEBSOCKET_STATS_URL = os.getenv("WEBSOCKET_STATS_URL", f"http://127.0.0.1:{WEBSOCKET_PORT}")
+WEBSOCKET_STATS_CACHE = 2
 WEBSOCKET_RECONNECT_DELAY = 5
+# Исходящая очередь каждого WebSocket клиента и что делать при переполнении:
+# drop_oldest, drop_newest или disconnect (медленный клиент отключается)
+WEBSOCKET_CLIENT_QUEUE_SIZE = 256
+WEBSOCKET_OVERFLOW_POLICY = os.getenv("WEBSOCKET_OVERFLOW_POLICY", "drop_oldest")
+# Отдельно запущенный websocket_server.py узнаёт о новых записях из общей
+# SQLite очереди: как часто проверять её изменения, секунды
+WEBSOCKET_QUEUE_RECHECK = 0.02
+
+ASYNC_RUNTIME = os.getenv("ASYNC_RUNTIME", "").lower() in ("1", "true", "yes")
+HTTP_WORKER_THREADS = 64
+# Отдельный пул для long-poll pull и SSE в асинхронном режиме
+HTTP_WAIT_THREADS = 64
+
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", os.path.join(tempfile.gettempdir(), "roblox_server_queue.db"))
+QUEUE_MAX_SIZE = 100
+SERVER_TTL = 10
+DEDUP_TTL = 60
+# Аренда записи потребителю до ack/nack; заметно короче SERVER_TTL, чтобы
+# запись упавшего клиента успела достаться другому
+LEASE_TTL = 3
+MAX_PULL_WAIT = 25
+PUSH_BATCH_MAX = 500
+# Отправка из Discord монитора в HTTP API (push_client): одновременных
+# запросов, длина очереди, повторы с задержкой PUSH_RETRY_DELAY * 2^n
+PUSH_MAX_IN_FLIGHT = 4
+PUSH_QUEUE_SIZE = 1000
+PUSH_MAX_RETRIES = 3
+PUSH_RETRY_DELAY = 0.5
+PUSH_TIMEOUT = 5
+SSE_KEEPALIVE_INTERVAL = 15
+# Открытая вкладка панели держит поток воркера (gthread) всё время, пока
+# открыта: больше SSE_MAX_STREAMS потоков на процесс под /api/events не
+# отдаём, остальным 503, чтобы push и pull не остались без потоков
+SSE_MAX_STREAMS = 8
 
 print(f"🔗 API URL: {API_URL}")
@@ -0,0 +1,104 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from colorama import Fore, Style
+
+from config import LOG_LEVEL, LOG_QUEUE_SIZE
+from metrics import LOG_RECORDS_DROPPED
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Кладёт запись в очередь как есть: форматирование и запись в stdout
+    выполняет поток listener. Если вывод не успевает и очередь полна,
+    запись выбрасывается, а не блокирует вызывающий код"""
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _ConsoleListener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # При остановке очередь может быть полна - ждём места для sentinel
+        self.queue.put(self._sentinel)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """[HH:MM:SS] [COMPONENT] <цвет>сообщение; время - момент вызова log"""
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created).strftime('%H:%M:%S')
+        component = getattr(record, 'component', None)
+        prefix = f"[{component}] " if component else ''
+        color = getattr(record, 'color', Fore.WHITE)
+        return f"[{timestamp}] {prefix}{color}{record.getMessage()}{Style.RESET_ALL}"
+
+
+class JsonDump:
+    """Отложенный json.dumps(indent=2): сериализация происходит в потоке вывода"""
+
+    __slots__ = ('data', )
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        try:
+            text = json.dumps(self.data, indent=2, ensure_ascii=False)
+        except Exception as e:
+            return f"Error formatting JSON: {e}"
+        return '\n'.join('  ' + line for line in text.split('\n'))
+
+
+class ConsoleLogger:
+    """log(message, color, level) для компонентов; запись уходит в общую очередь"""
+
+    def __init__(self, component=None):
+        self.component = component
+        self._logger = _pipeline()
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def log(self, message, color=Fore.WHITE, level=logging.INFO):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, extra={'color': color, 'component': self.component})
+
+
+_logger = None
+_listener = None
+_lock = threading.Lock()
+
+
+def _pipeline():
+    global _logger, _listener
+    with _lock:
+        if _logger is None:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(ConsoleFormatter())
+            _listener = _ConsoleListener(queue.Queue(LOG_QUEUE_SIZE), handler)
+            _listener.start()
+            atexit.register(_listener.stop)
+
+            logger = logging.getLogger('autojoiner.console')
+            logger.setLevel(logging.getLevelName(LOG_LEVEL.upper()))
+            logger.propagate = False
+            logger.addHandler(_DeferredQueueHandler(_listener.queue))
+            _logger = logger
+    return _logger
+
+
+def get_logger(component=None):
+    return ConsoleLogger(component)
@@ -35,6 +35,10 @@ if [ ! -f "$PROJECT_DIR/.env" ]; then
 # Опциональный Discord токен (раскомментируйте и укажите токен для включения Discord мониторинга)
 # DISCORD_TOKEN=your_discord_token_here
 
+# Секрет для изменения настроек через POST /api/config (заголовок X-Config-Token).
+# Без него API настроек только читает; файл runtime_config.json работает всегда
+# CONFIG_API_TOKEN=long_random_secret
+
 # API URL (будет автоматически установлен на домен)
 API_URL=https://icehub.work.gd
 EOF
@@ -54,7 +58,7 @@ User=www-data
 WorkingDirectory=/opt/roblox-auto-joiner
 Environment="PATH=/opt/roblox-auto-joiner/venv/bin"
 EnvironmentFile=/opt/roblox-auto-joiner/.env
-ExecStart=/opt/roblox-auto-joiner/venv/bin/gunicorn -w 4 -b 127.0.0.1:5000 --reuse-port main:app
+ExecStart=/opt/roblox-auto-joiner/venv/bin/gunicorn -w 4 -k gthread --threads 32 -b 127.0.0.1:5000 --reuse-port main:app
 Restart=always
 RestartSec=10
 
@@ -17,7 +17,7 @@ echo "📦 Копирование файлов на $SSH_USER@$SERVER_IP..."
 
 cd ..
 
-scp -r config.py main.py websocket_server.py discord_bot_http.py index.html requirements.txt deploy $SSH_USER@$SERVER_IP:/tmp/roblox-project/
+scp -r config.py main.py async_runtime.py console_log.py filter_engine.py gateway_frame.py message_parser.py metrics.py parse_cache.py push_client.py runtime_config.py subscriptions.py server_entry.py server_store.py websocket_server.py wire_format.py discord_bot_http.py index.html requirements.txt deploy $SSH_USER@$SERVER_IP:/tmp/roblox-project/
 
 echo ""
 echo "📡 Подключение к серверу и запуск установки..."
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+import json
+import sys
+import time
+import uuid
+
+import websockets
+from colorama import Fore, Style
+
+from config import MONITORED_CHANNELS
+from discord_bot_http import DiscordMonitor
+from parser_bench import CORPUS_DIR, load_corpus
+
+DISRUPTIONS = ('drop', 'reconnect', 'invalid_session')
+
+
+class FakeSession:
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        # Все dispatch сессии: s события = индекс + 1
+        self.log = []
+        self.websocket = None
+        self.lock = asyncio.Lock()
+
+
+class FakeGateway:
+    """Локальный Discord Gateway для проверки переподключений монитора.
+
+    После IDENTIFY сессия выпускает total событий MESSAGE_CREATE (сообщения из
+    parser_corpus) независимо от того, подключён ли клиент, и каждые
+    disrupt_every событий рвёт соединение: обрыв TCP, op 7 или op 9 (d=true).
+    RESUME досылает события после присланного seq и завершается RESUMED.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, total=200, event_interval=0.01,
+                 disrupt_every=25, heartbeat_interval=1000, corpus_path=CORPUS_DIR):
+        self.host = host
+        self.port = port
+        self.total = total
+        self.event_interval = event_interval
+        self.disrupt_every = disrupt_every
+        self.heartbeat_interval = heartbeat_interval
+        self.messages = [message for _, message, _ in load_corpus(corpus_path)]
+        self.sessions = {}
+        self.disruptions = itertools.cycle(DISRUPTIONS)
+        self.stats = {'identify': 0, 'resume': 0, 'replayed': 0, 'disruptions': 0}
+        self.server = None
+        self.producers = set()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for producer in self.producers:
+            producer.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_client(self, websocket):
+        await websocket.send(json.dumps({"op": 10, "d": {"heartbeat_interval": self.heartbeat_interval}}))
+        session = None
+        try:
+            async for raw in websocket:
+                frame = json.loads(raw)
+                if frame['op'] == 1:
+                    await websocket.send(json.dumps({"op": 11}))
+                elif frame['op'] == 2:
+                    session = await self.identify(websocket)
+                elif frame['op'] == 6:
+                    session = await self.resume(websocket, frame['d'])
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if session and session.websocket is websocket:
+                session.websocket = None
+
+    async def identify(self, websocket):
+        self.stats['identify'] += 1
+        session = FakeSession(uuid.uuid4().hex)
+        self.sessions[session.session_id] = session
+        async with session.lock:
+            self.append(session, 'READY', {"session_id": session.session_id, "resume_gateway_url": self.url})
+            await websocket.send(session.log[-1])
+            session.websocket = websocket
+        producer = asyncio.create_task(self.produce(session))
+        self.producers.add(producer)
+        producer.add_done_callback(self.producers.discard)
+        return session
+
+    async def resume(self, websocket, data):
+        session = self.sessions.get(data.get('session_id'))
+        if session is None or data.get('seq') is None or data['seq'] > len(session.log):
+            await websocket.send(json.dumps({"op": 9, "d": False}))
+            return None
+        self.stats['resume'] += 1
+        async with session.lock:
+            missed = session.log[data['seq']:]
+            for frame in missed:
+                await websocket.send(frame)
+            self.stats['replayed'] += len(missed)
+            await websocket.send(json.dumps({"op": 0, "t": "RESUMED", "s": None, "d": {}}))
+            session.websocket = websocket
+        return session
+
+    @staticmethod
+    def append(session, event, data):
+        session.log.append(json.dumps({"op": 0, "t": event, "s": len(session.log) + 1, "d": data}))
+
+    async def produce(self, session):
+        for number in range(1, self.total + 1):
+            await asyncio.sleep(self.event_interval)
+            message = dict(self.messages[number % len(self.messages)],
+                           id=str(number),
+                           channel_id=MONITORED_CHANNELS[0])
+            async with session.lock:
+                self.append(session, 'MESSAGE_CREATE', message)
+                if session.websocket is not None:
+                    try:
+                        await session.websocket.send(session.log[-1])
+                    except websockets.exceptions.ConnectionClosed:
+                        session.websocket = None
+            if self.disrupt_every and number % self.disrupt_every == 0:
+                await self.disrupt(session)
+
+    async def disrupt(self, session):
+        async with session.lock:
+            websocket, session.websocket = session.websocket, None
+        if websocket is None:
+            return
+        self.stats['disruptions'] += 1
+        # Следующие события копятся в log, пока клиент не пришлёт RESUME
+        kind = next(self.disruptions)
+        if kind == 'drop':
+            websocket.transport.abort()
+        elif kind == 'reconnect':
+            await websocket.send(json.dumps({"op": 7, "d": None}))
+        else:
+            await websocket.send(json.dumps({"op": 9, "d": True}))
+
+
+async def run_check(total=200, disrupt_every=25, timeout=60.0):
+    """Монитор против FakeGateway: каждое событие должно прийти ровно один раз
+    при одном IDENTIFY, остальные подключения - через RESUME"""
+    gateway = FakeGateway(total=total, disrupt_every=disrupt_every)
+    await gateway.start()
+    print(f"🛰️ Fake gateway on {gateway.url}: {total} events, disruption every {disrupt_every}")
+
+    received = []
+    monitor = DiscordMonitor('http://gateway-check.invalid', gateway_url=f"{gateway.url}/?v=10&encoding=json")
+
+    async def record(message_data, received_at=None):
+        received.append(message_data['id'])
+
+    monitor.process_discord_message = record
+    monitor_task = asyncio.create_task(monitor.connect_discord())
+    started = time.monotonic()
+    while len(set(received)) < total and time.monotonic() - started < timeout:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+
+    monitor.paused = True
+    monitor_task.cancel()
+    await asyncio.gather(monitor_task, return_exceptions=True)
+    await gateway.stop()
+
+    unique = len(set(received))
+    duplicates = len(received) - unique
+    ok = unique == total and duplicates == 0 and gateway.stats['identify'] == 1
+    color = Fore.GREEN if ok else Fore.RED
+    print(f"{color}📨 Received {unique}/{total} events, {duplicates} duplicate(s) in {elapsed:.1f}s{Style.RESET_ALL}")
+    print(f"🔁 Identify: {gateway.stats['identify']}, resume: {gateway.stats['resume']}, "
+          f"replayed: {gateway.stats['replayed']}, disruptions: {gateway.stats['disruptions']}")
+    return ok
+
+
+async def serve(port):
+    gateway = FakeGateway(port=port, total=10**9, event_interval=1.0, disrupt_every=30)
+    await gateway.start()
+    print(f"🛰️ Fake gateway on {gateway.url}; run the bot with "
+          f"DISCORD_GATEWAY_URL='{gateway.url}/?v=10&encoding=json'")
+    await asyncio.Future()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        asyncio.run(serve(int(sys.argv[2]) if len(sys.argv) > 2 else 8790))
+    else:
+        sys.exit(0 if asyncio.run(run_check()) else 1)
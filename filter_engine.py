@@ -0,0 +1,186 @@
+import math
+import operator
+
+# Относительная стоимость проверки: сравнение с None/bool дешевле диапазона,
+# диапазон дешевле поиска во множестве, lower() ещё дороже
+OP_COSTS = {'required': 1, 'forbidden': 1, 'range': 2, 'in': 3, 'not_in': 3}
+LOWER_COST = 2
+REORDER_EVERY = 1024
+
+
+def build_rules(settings):
+    """Спецификации правил из настроек фильтров (config или снимок runtime_config).
+
+    Правило с 'source' применяется только к этому источнику, выключенные
+    ('enabled': False) не компилируются.
+    """
+    ice_hub = settings['ICE_HUB_FILTER']
+    money = settings['MONEY_THRESHOLD']
+    player_threshold = settings['PLAYER_THRESHOLD']
+    by_name = settings['FILTER_BY_NAME']
+    return [
+        {'name': 'job_id_required', 'field': 'job_id', 'op': 'required',
+         'reason': "No job_id parsed (message format not recognized)"},
+        {'name': 'ice_hub_job_id', 'source': 'ice_hub', 'field': 'job_id', 'op': 'required',
+         'enabled': ice_hub['enabled'] and ice_hub['require_job_id'],
+         'reason': "Ice Hub message missing required job_id"},
+        {'name': 'ice_hub_players', 'source': 'ice_hub', 'field': 'player_count', 'op': 'range',
+         'min': ice_hub['min_players'], 'max': ice_hub['max_players'],
+         'enabled': ice_hub['enabled'],
+         'reason': "Ice Hub players {value} not in range ({min}, {max})"},
+        {'name': 'ice_hub_zero_income', 'source': 'ice_hub', 'field': 'money', 'op': 'not_in',
+         'values': [0], 'enabled': ice_hub['enabled'] and ice_hub['ignore_zero_income'],
+         'reason': "Ice Hub server has zero income (ignored)"},
+        {'name': 'money_range', 'field': 'money', 'op': 'range',
+         'min': money['min'], 'max': money['max'],
+         'reason': "Money ${value}M/s not in range ({min}, {max})"},
+        {'name': 'player_threshold', 'field': 'player_count', 'op': 'range',
+         'max': player_threshold - 1,
+         'reason': "Players {value} >= threshold " + str(player_threshold)},
+        {'name': 'ignore_unknown', 'field': 'name', 'op': 'not_in', 'values': ['unknown'],
+         'lower': True, 'enabled': settings['IGNORE_UNKNOWN'],
+         'reason': "Name is 'Unknown' (ignored)"},
+        {'name': 'ignore_list', 'field': 'name', 'op': 'not_in', 'values': settings['IGNORE_LIST'],
+         'enabled': bool(settings['IGNORE_LIST']),
+         'reason': "Name '{value}' in ignore list"},
+        {'name': 'allowed_names', 'field': 'name', 'op': 'in', 'values': by_name['allowed_names'],
+         'enabled': by_name['enabled'],
+         'reason': "Name '{value}' not in allowed list"},
+        {'name': 'bypass_10m', 'field': 'is_10m_plus', 'op': 'forbidden',
+         'enabled': not settings['BYPASS_10M'],
+         'reason': "10M+ server blocked by configuration"},
+    ]
+
+
+class FilterRule:
+    """Скомпилированное правило из спецификации вида
+    {'name', 'field', 'op', ['source'], ['reason'], параметры op}.
+
+    op: required / forbidden - поле должно быть истинным / ложным;
+    range - min <= значение <= max (границы необязательны);
+    in / not_in - значение (или value.lower() при 'lower': True) во множестве
+    'values' / вне его. Для range, in и not_in пустое значение (None, '')
+    правило пропускает, как и прежняя цепочка if.
+    """
+
+    __slots__ = ('name', 'source', 'field', 'op', 'spec', 'get', 'check', 'skip_empty',
+                 'cost', 'counters')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.source = spec.get('source')
+        self.field = spec['field']
+        self.op = spec['op']
+        if self.op not in OP_COSTS:
+            raise ValueError(f"Unknown filter op '{self.op}' in rule '{self.name}'")
+        self.get = operator.attrgetter(self.field)
+        self.skip_empty = self.op not in ('required', 'forbidden')
+        self.cost = OP_COSTS[self.op] + (LOWER_COST if spec.get('lower') else 0)
+        self.check = self.compile_check()
+        self.counters = {'passed': 0, 'rejected': 0}
+
+    def compile_check(self):
+        spec = self.spec
+        if self.op == 'required':
+            return bool
+        if self.op == 'forbidden':
+            return operator.not_
+        if self.op == 'range':
+            low = spec.get('min', -math.inf)
+            high = spec.get('max', math.inf)
+            return lambda value: low <= value <= high
+
+        lower = spec.get('lower', False)
+        values = frozenset(value.lower() if lower else value for value in spec['values'])
+        if self.op == 'in':
+            if lower:
+                return lambda value: value.lower() in values
+            return values.__contains__
+        if lower:
+            return lambda value: value.lower() not in values
+        return lambda value: value not in values
+
+    def reject_rate(self):
+        # Сглаживание Лапласа: у нового правила оценка 1/2
+        return (self.counters['rejected'] + 1) / (
+            self.counters['passed'] + self.counters['rejected'] + 2)
+
+    def reason(self, value):
+        template = self.spec.get('reason')
+        if template is None:
+            return f"{self.field} {value!r} rejected by {self.name}"
+        return template.format(value=value, **self.spec)
+
+
+class FilterEngine:
+    """Правила фильтрации как данные, скомпилированные в конвейеры по источникам.
+
+    Для каждого источника заранее собран кортеж применимых правил (общие +
+    с этим 'source'). Порядок - по возрастанию стоимость / доля отказов, так
+    что дешёвые и часто отсеивающие проверки идут первыми; каждые
+    REORDER_EVERY проверок порядок пересчитывается по накопленным счётчикам.
+    """
+
+    def __init__(self, rule_specs, counters=None):
+        self.rules = []
+        self.pipelines = {}
+        self.default = ()
+        self.counters = {}
+        self.evaluations = 0
+        self.compile(rule_specs, counters)
+
+    def compile(self, rule_specs, counters=None):
+        """counters - счётчики прежнего движка: одноимённые правила продолжают их"""
+        self.rules = [FilterRule(spec) for spec in rule_specs if spec.get('enabled', True)]
+        for rule in self.rules:
+            if counters and rule.name in counters:
+                rule.counters = counters[rule.name]
+        # Живые dict счётчиков правил: stats API отдаёт их без копирования на
+        # каждое сообщение
+        self.counters = {rule.name: rule.counters for rule in self.rules}
+        self.reorder()
+
+    def reorder(self):
+        ordered = sorted(self.rules, key=lambda rule: rule.cost / rule.reject_rate())
+        sources = {rule.source for rule in ordered if rule.source is not None}
+        self.default = tuple(rule for rule in ordered if rule.source is None)
+        self.pipelines = {
+            source: tuple(rule for rule in ordered if rule.source in (None, source))
+            for source in sources
+        }
+
+    def apply(self, entry):
+        """-> {'passed': True} или {'passed': False, 'rule', 'reason'} по первому отказу;
+        в 'passed_rules' - имена пройденных правил для count()"""
+        self.evaluations += 1
+        if self.evaluations % REORDER_EVERY == 0:
+            self.reorder()
+
+        rejected = None
+        passed_rules = []
+        for rule in self.pipelines.get(entry.source, self.default):
+            value = rule.get(entry)
+            if rule.skip_empty and (value is None or value == ''):
+                continue
+            if rule.check(value):
+                rule.counters['passed'] += 1
+                passed_rules.append(rule.name)
+            else:
+                rule.counters['rejected'] += 1
+                rejected = rule
+                break
+
+        if rejected is None:
+            return {'passed': True, 'passed_rules': passed_rules}
+        return {'passed': False, 'rule': rejected.name, 'reason': rejected.reason(value),
+                'passed_rules': passed_rules}
+
+    def count(self, result):
+        """Учитывает в счётчиках правил вердикт apply(), взятый из кэша разбора"""
+        for name in result['passed_rules']:
+            counters = self.counters.get(name)
+            if counters is not None:
+                counters['passed'] += 1
+        if not result['passed'] and result['rule'] in self.counters:
+            self.counters[result['rule']]['rejected'] += 1
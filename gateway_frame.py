@@ -0,0 +1,40 @@
+import re
+
+# Discord сериализует кадр как {"t":..,"s":..,"op":..,"d":{..}}: заголовок
+# читается из текста до первого "d", не разбирая полезную нагрузку
+_COMPACT_HEADER = re.compile(r'\{"t":(?:"([A-Z_]*)"|null),"s":(?:(\d+)|null),"op":(\d+),"d":')
+_HEADER_FIELD = re.compile(r'"(op|t|s)"\s*:\s*(?:"([A-Z_]*)"|(\d+)|null)')
+_CHANNEL_ID = re.compile(r'"channel_id"\s*:\s*"(\d+)"')
+_PAYLOAD_KEY = re.compile(r'"d"\s*:')
+
+
+def scan_frame(raw):
+    """-> (op, t, s, d_start) по сырому тексту кадра или None, если заголовок
+    не удалось прочитать (порядок ключей другой, bytes, …) - тогда кадр нужно
+    разбирать json.loads целиком"""
+    if not isinstance(raw, str):
+        return None
+    compact = _COMPACT_HEADER.match(raw)
+    if compact:
+        event, sequence, op = compact.groups()
+        return int(op), event, int(sequence) if sequence else None, compact.end()
+
+    end = raw.find('"d":')
+    if end >= 0:
+        payload_start = end + 4
+    else:
+        payload = _PAYLOAD_KEY.search(raw)
+        end, payload_start = (payload.start(), payload.end()) if payload else (len(raw), len(raw))
+    header = {}
+    for key, text, number in _HEADER_FIELD.findall(raw, 0, end):
+        header[key] = number or text or None
+    if header.get('op') is None:
+        return None
+    sequence = header.get('s')
+    return int(header['op']), header.get('t'), int(sequence) if sequence else None, payload_start
+
+
+def channel_ids(raw, start=0):
+    """Все значения "channel_id" в кадре, включая вложенные (message_reference,
+    snapshots): по ним можно только отбросить кадр, где ни один id не подходит"""
+    return _CHANNEL_ID.findall(raw, start)
@@ -1,13 +1,27 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 import threading
 import time
 from datetime import datetime
 from collections import deque
+import asyncio
+import hmac
+import json
+import math
 import os
+import queue
+import sys
+import requests
+from urllib.parse import parse_qs
+
+from config import ASYNC_RUNTIME, CONFIG_API_TOKEN, HTTP_WAIT_THREADS, HTTP_WORKER_THREADS, QUEUE_DB_PATH, QUEUE_MAX_SIZE, SERVER_TTL, DEDUP_TTL, LEASE_TTL, MAX_PULL_WAIT, SSE_KEEPALIVE_INTERVAL, SSE_MAX_STREAMS, PUSH_BATCH_MAX, WEBSOCKET_STATS_URL, WEBSOCKET_STATS_CACHE
+from metrics import STAGE_LATENCY, QUEUE_PUSHES, QUEUE_REMOVALS, render_metrics
+from runtime_config import RUNTIME_CONFIG
+from server_entry import ServerEntry
+from server_store import EventFeed, ServerQueueStore
 
 try:
-    from discord_bot_http import start_discord_bot_background, discord_stats
+    from discord_bot_http import start_discord_bot_background, discord_stats, DiscordMonitor, API_URL
     DISCORD_BOT_AVAILABLE = True
 except Exception as e:
     print(f"⚠️ Discord bot not available: {e}")
@@ -25,9 +39,54 @@ except Exception as e:
 app = Flask(__name__)
 CORS(app)
 
-server_queue = deque(maxlen=100)
+server_queue = ServerQueueStore(QUEUE_DB_PATH, max_size=QUEUE_MAX_SIZE, ttl=SERVER_TTL, dedup_ttl=DEDUP_TTL, lease_ttl=LEASE_TTL)
 ping_logs = deque(maxlen=50)
+
+def observe_queue_timing(event, seconds):
+    if event == 'handout':
+        STAGE_LATENCY.observe(seconds, 'push_to_pull')
+    else:
+        STAGE_LATENCY.observe(seconds, 'time_in_queue')
+        QUEUE_REMOVALS.inc(event)
+
+server_queue.timing_hook = observe_queue_timing
+event_feed = EventFeed(server_queue)
+sse_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
 websocket_clients = 0
+websocket_server = None
+
+def record_push(entry, result):
+    """Учёт принятой записи; новые сразу уходят WebSocket клиентам, не
+    дожидаясь их опроса /api/server/pull"""
+    QUEUE_PUSHES.inc(entry.source, result['status'])
+    if result['status'] == 'added' and websocket_server is not None:
+        websocket_server.publish(entry)
+
+websocket_stats_cache = {'at': 0.0, 'stats': None}
+
+def remote_websocket_stats(max_age=0):
+    """{'overflow_policy', 'clients'} отдельно запущенного websocket_server.py
+    (deploy/install.sh) или None, если он недоступен; max_age - сколько
+    секунд можно отдавать прошлый ответ"""
+    now = time.monotonic()
+    if now - websocket_stats_cache['at'] < max_age:
+        return websocket_stats_cache['stats']
+    try:
+        response = requests.get(WEBSOCKET_STATS_URL + '/clients', timeout=1)
+        response.raise_for_status()
+        stats = response.json()
+    except (requests.RequestException, ValueError):
+        stats = None
+    websocket_stats_cache.update(at=now, stats=stats)
+    return stats
+
+def connected_websocket_clients():
+    if websocket_server is not None:
+        return websocket_server.get_connected_clients_count()
+    stats = remote_websocket_stats(max_age=WEBSOCKET_STATS_CACHE)
+    if stats is not None:
+        return len(stats['clients'])
+    return websocket_clients
 
 @app.route('/')
 def index():
@@ -38,10 +97,40 @@ def get_status():
     return jsonify({
         'status': 'online',
         'queue_size': len(server_queue),
-        'websocket_clients': websocket_clients,
+        'websocket_clients': connected_websocket_clients(),
+        'dedup': server_queue.dedup_stats(),
         'timestamp': datetime.now().isoformat()
     })
 
+PUSH_MESSAGES = {
+    'added': 'Server added to queue',
+    'merged': 'Server merged with queued duplicate',
+    'duplicate': 'Server already delivered, duplicate ignored'
+}
+
+def build_server_entry(data, strict=True):
+    """strict (пакетный push): нечисловой money - ValueError. Одиночный push,
+    как и раньше, принимает любой money: число из строки ("12.5") берётся как
+    число, остальное остаётся только в money_raw, чтобы сортировка и
+    подписки сравнивали числа"""
+    if not isinstance(data, dict):
+        raise ValueError('Server record must be a JSON object')
+    
+    money = data.get('money')
+    if money is not None and (isinstance(money, bool) or not isinstance(money, (int, float))):
+        if strict:
+            raise ValueError('money must be a number')
+        try:
+            number = float(money) if isinstance(money, str) else None
+        except ValueError:
+            number = None
+        if number is None or not math.isfinite(number):
+            data = dict(data, money=None, money_raw=data.get('money_raw') or str(money))
+        else:
+            data = dict(data, money=number)
+    
+    return ServerEntry.from_dict(data)
+
 @app.route('/api/server/push', methods=['POST'])
 def push_server():
     try:
@@ -49,23 +138,89 @@ def push_server():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        server_data = {
-            'name': data.get('name'),
-            'money': data.get('money'),
-            'players': data.get('players'),
-            'job_id': data.get('job_id'),
-            'script': data.get('script'),
-            'join_link': data.get('join_link'),
-            'is_10m_plus': data.get('is_10m_plus', False),
-            'timestamp': datetime.now().isoformat()
-        }
+        try:
+            entry = build_server_entry(data, strict=False)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = server_queue.push(entry)
+        record_push(entry, result)
+        
+        return jsonify({
+            'success': True,
+            'message': PUSH_MESSAGES[result['status']],
+            'status': result['status'],
+            'queue_size': result['queue_size']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def parse_batch_body(body, content_type):
+    """JSON массив или NDJSON (по записи на строку) -> список (запись или ошибка)"""
+    stripped = body.lstrip()
+    if 'ndjson' not in content_type and stripped.startswith('['):
+        records = json.loads(stripped)
+        if not isinstance(records, list):
+            raise ValueError('Batch body must be a JSON array')
+        return [(record, None) for record in records]
+    
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append((json.loads(line), None))
+        except json.JSONDecodeError as e:
+            items.append((None, f'Invalid JSON: {e}'))
+    return items
+
+@app.route('/api/server/push_batch', methods=['POST'])
+def push_server_batch():
+    try:
+        try:
+            items = parse_batch_body(request.get_data(as_text=True), request.content_type or '')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not items:
+            return jsonify({'error': 'No data provided'}), 400
+        if len(items) > PUSH_BATCH_MAX:
+            return jsonify({'error': f'Batch too large (max {PUSH_BATCH_MAX} records)'}), 413
         
-        server_queue.append(server_data)
+        entries = []
+        errors = []
+        for record, error in items:
+            if error is None:
+                try:
+                    entries.append(build_server_entry(record))
+                    errors.append(None)
+                    continue
+                except ValueError as e:
+                    error = str(e)
+            entries.append(None)
+            errors.append(error)
+        
+        push_results, queue_size = server_queue.push_many(entries)
+        for entry, result in zip(entries, push_results):
+            if result is not None:
+                record_push(entry, result)
+        
+        results = []
+        for index, (result, error) in enumerate(zip(push_results, errors)):
+            if error is not None:
+                results.append({'index': index, 'status': 'error', 'error': error})
+            else:
+                results.append({
+                    'index': index,
+                    'status': result['status'],
+                    'message': PUSH_MESSAGES[result['status']]
+                })
         
         return jsonify({
             'success': True,
-            'message': 'Server added to queue',
-            'queue_size': len(server_queue)
+            'accepted': sum(1 for error in errors if error is None),
+            'results': results,
+            'queue_size': queue_size
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -73,19 +228,60 @@ def push_server():
 @app.route('/api/server/pull', methods=['GET'])
 def pull_server():
     try:
-        if len(server_queue) == 0:
-            return jsonify({'status': 'success', 'data': None, 'queue_size': 0})
+        try:
+            wait = float(request.args.get('wait', 0))
+        except ValueError:
+            return jsonify({'status': 'error', 'error': 'wait must be a number'}), 400
+        wait = max(0.0, min(wait, MAX_PULL_WAIT))
         
-        server_data = server_queue.popleft()
+        consumer_id = request.args.get('consumer_id') or None
+        mode = request.args.get('mode', 'lease')
+        if mode not in ('lease', 'broadcast'):
+            return jsonify({'status': 'error', 'error': "mode must be 'lease' or 'broadcast'"}), 400
+        if mode == 'broadcast' and consumer_id is None:
+            return jsonify({'status': 'error', 'error': 'broadcast mode requires consumer_id'}), 400
+        
+        entry, queue_size = server_queue.pull(wait=wait, consumer_id=consumer_id, mode=mode)
+        
+        server_data = None
+        if entry is not None:
+            server_data = entry.to_dict()
+            if consumer_id is not None:
+                server_data['lease_id'] = entry.queue_id
+                if mode == 'lease':
+                    server_data['lease_expires_in'] = round(server_queue.lease_duration(entry), 3)
         
         return jsonify({
             'status': 'success',
             'data': server_data,
-            'queue_size': len(server_queue)
+            'queue_size': queue_size
         })
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
+def settle_lease(settle):
+    try:
+        data = request.json or {}
+        consumer_id = data.get('consumer_id')
+        lease_id = data.get('lease_id')
+        if not consumer_id or not isinstance(lease_id, int):
+            return jsonify({'status': 'error', 'error': 'consumer_id and lease_id are required'}), 400
+        
+        if not settle(lease_id, str(consumer_id)):
+            return jsonify({'status': 'error', 'error': 'Lease not found or expired'}), 409
+        
+        return jsonify({'status': 'success', 'queue_size': len(server_queue)})
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/api/server/ack', methods=['POST'])
+def ack_server():
+    return settle_lease(server_queue.ack)
+
+@app.route('/api/server/nack', methods=['POST'])
+def nack_server():
+    return settle_lease(server_queue.nack)
+
 @app.route('/api/ping', methods=['POST'])
 def ping():
     try:
@@ -126,15 +322,7 @@ def get_discord_stats():
 @app.route('/api/discord/queue', methods=['GET'])
 def get_discord_queue():
     try:
-        queue_list = list(server_queue)
-        current_time = datetime.now()
-        
-        for server in queue_list:
-            if 'timestamp' in server:
-                server_time = datetime.fromisoformat(server['timestamp'])
-                age_seconds = (current_time - server_time).total_seconds()
-                server['age_seconds'] = age_seconds
-                server['time_remaining'] = max(0, 10 - age_seconds)
+        queue_list = server_queue.snapshot()
         
         return jsonify({
             'success': True,
@@ -144,44 +332,208 @@ def get_discord_queue():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/websocket/clients', methods=['GET'])
+def get_websocket_clients():
+    if websocket_server is not None:
+        stats = {'overflow_policy': websocket_server.overflow_policy,
+                 'clients': websocket_server.get_clients_stats()}
+    else:
+        stats = remote_websocket_stats()
+        if stats is None:
+            return jsonify({'success': False, 'error': 'WebSocket server unavailable',
+                            'clients': [], 'total': 0}), 503
+    return jsonify({
+        'success': True,
+        'overflow_policy': stats['overflow_policy'],
+        'clients': stats['clients'],
+        'total': len(stats['clients'])
+    })
+
+@app.route('/api/config', methods=['GET'])
+def get_runtime_config():
+    return jsonify({'success': True, 'config': RUNTIME_CONFIG.to_dict()})
+
+@app.route('/api/config', methods=['POST'])
+def update_runtime_config():
+    if not CONFIG_API_TOKEN:
+        return jsonify({'success': False, 'error': 'Config updates are disabled: CONFIG_API_TOKEN is not set'}), 403
+    token = request.headers.get('X-Config-Token', '')
+    if not hmac.compare_digest(token.encode(), CONFIG_API_TOKEN.encode()):
+        return jsonify({'success': False, 'error': 'Missing or invalid X-Config-Token'}), 401
+    
+    try:
+        RUNTIME_CONFIG.update(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'config': RUNTIME_CONFIG.to_dict()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def dashboard_stats():
+    stats = discord_stats.copy()
+    stats['unique_servers'] = len(discord_stats['unique_servers'])
+    stats['queue_size'] = len(server_queue)
+    stats['websocket_clients'] = connected_websocket_clients()
+    return stats
+
+def format_sse(event, data, event_id=None):
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n" + message
+    return message
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    if not sse_streams.acquire(blocking=False):
+        return jsonify({'status': 'error', 'error': 'Too many event streams'}), 503, {
+            'Retry-After': str(SSE_KEEPALIVE_INTERVAL)
+        }
+    
+    def generate():
+        last_event_id = server_queue.last_event_id()
+        stats = dashboard_stats()
+        yield format_sse('snapshot', {
+            'queue': server_queue.snapshot(),
+            'stats': stats,
+            'ttl': SERVER_TTL
+        }, last_event_id)
+        
+        while True:
+            events = event_feed.read(last_event_id, wait=SSE_KEEPALIVE_INTERVAL)
+            if not events:
+                # Простой: только комментарий, чтобы прокси не закрыл соединение,
+                # статистику не пересчитываем и в SQLite не ходим
+                yield ": keepalive\n\n"
+                continue
+            
+            for event_id, kind, data in events:
+                if kind in ('add', 'update'):
+                    server = dict(data['server'], id=data['id'])
+                    server['time_remaining'] = max(0, data['deadline'] - time.monotonic())
+                    data = server
+                yield format_sse(kind, data, event_id)
+                last_event_id = event_id
+            
+            # Счётчики меняются вместе с очередью: пересчитываем их только после событий
+            current = dashboard_stats()
+            delta = {key: value for key, value in current.items() if stats.get(key) != value}
+            if delta:
+                yield format_sse('stats', delta)
+                stats = current
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Слот освобождается, когда сервер закрывает ответ, даже если генератор
+    # так и не запустился
+    response.call_on_close(sse_streams.release)
+    return response
+
 def cleanup_old_servers():
     while True:
         try:
-            time.sleep(10)
-            current_time = datetime.now()
-            
-            cleaned_count = 0
-            for _ in range(len(server_queue)):
-                if len(server_queue) == 0:
-                    break
-                    
-                server = server_queue[0]
-                server_time = datetime.fromisoformat(server['timestamp'])
-                age = (current_time - server_time).total_seconds()
-                
-                if age > 10:
-                    server_queue.popleft()
-                    cleaned_count += 1
-                else:
-                    break
+            cleaned_count = server_queue.expire_when_due(max_wait=60)
             
             if cleaned_count > 0:
                 print(f"🧹 Cleaned {cleaned_count} old servers from queue")
         except Exception as e:
             print(f"Error in cleanup thread: {e}")
+            time.sleep(1)
 
 cleanup_thread = threading.Thread(target=cleanup_old_servers, daemon=True)
 cleanup_thread.start()
+RUNTIME_CONFIG.start_watching()
+
+# Записи Discord монитора, работающего в соседнем потоке этого же процесса:
+# монитор только кладёт запись, SQLite запись делает отдельный поток
+monitor_handoff = queue.SimpleQueue()
+
+def drain_monitor_handoff():
+    while True:
+        entries = [monitor_handoff.get()]
+        while len(entries) < PUSH_BATCH_MAX:
+            try:
+                entries.append(monitor_handoff.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            results, _ = server_queue.push_many(entries)
+            for entry, result in zip(entries, results):
+                record_push(entry, result)
+        except Exception as e:
+            print(f"Error in monitor handoff thread: {e}")
+
+async def handoff_from_monitor(entry):
+    monitor_handoff.put(entry)
+
+async def enqueue_from_monitor(entry):
+    # push ждёт блокировку и транзакцию SQLite: в пуле, чтобы не стопорить loop
+    loop = asyncio.get_running_loop()
+    record_push(entry, await loop.run_in_executor(None, server_queue.push, entry))
+
+def is_waiting_request(environ):
+    """Запрос ждёт событий очереди (SSE или pull с wait > 0)"""
+    path = environ.get('PATH_INFO')
+    if path == '/api/events':
+        return True
+    if path != '/api/server/pull':
+        return False
+    wait = parse_qs(environ.get('QUERY_STRING', '')).get('wait')
+    try:
+        return bool(wait) and float(wait[0]) > 0
+    except ValueError:
+        return False
+
+async def run_async_runtime(port):
+    """HTTP API, WebSocket сервер и Discord монитор в одном event loop"""
+    global websocket_server
+    from async_runtime import AsyncWSGIServer
+    from websocket_server import RobloxWebSocketServer
+    
+    websocket_server = RobloxWebSocketServer()
+    http_server = AsyncWSGIServer(app, '0.0.0.0', port, max_workers=HTTP_WORKER_THREADS,
+                                  wait_workers=HTTP_WAIT_THREADS, is_waiting=is_waiting_request)
+    tasks = [
+        asyncio.create_task(http_server.start()),
+        asyncio.create_task(websocket_server.start())
+    ]
+    
+    if DISCORD_BOT_AVAILABLE and os.environ.get('DISCORD_TOKEN'):
+        discord_stats['bot_status'] = 'Starting...'
+        monitor = DiscordMonitor(API_URL, server_sink=enqueue_from_monitor)
+        tasks.append(asyncio.create_task(monitor.connect_discord()))
+        print("✅ Discord bot started on the shared event loop")
+    else:
+        if not os.environ.get('DISCORD_TOKEN'):
+            print("⚠️ DISCORD_TOKEN not found in environment variables")
+        print("ℹ️ Discord bot monitoring disabled")
+    
+    await asyncio.gather(*tasks)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    print(f"🚀 Starting Flask server on 0.0.0.0:{port}")
     print(f"🔗 API URL: {os.environ.get('RENDER_EXTERNAL_URL', f'http://localhost:{port}')}")
     
+    if ASYNC_RUNTIME or '--async' in sys.argv:
+        print(f"🚀 Starting async runtime on 0.0.0.0:{port}")
+        try:
+            asyncio.run(run_async_runtime(port))
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        sys.exit(0)
+    
+    print(f"🚀 Starting Flask server on 0.0.0.0:{port}")
+    
     websocket_server_thread = None
     try:
-        from websocket_server import start_websocket_server
-        websocket_server_thread = threading.Thread(target=start_websocket_server, daemon=True)
+        from websocket_server import RobloxWebSocketServer, start_websocket_server
+        websocket_server = RobloxWebSocketServer()
+        websocket_server_thread = threading.Thread(target=start_websocket_server, args=(websocket_server,), daemon=True)
         websocket_server_thread.start()
         print("✅ WebSocket server started on port 8765")
     except Exception as e:
@@ -190,9 +542,12 @@ if __name__ == '__main__':
     discord_bot_thread = None
     if DISCORD_BOT_AVAILABLE and os.environ.get('DISCORD_TOKEN'):
         try:
-            discord_bot_thread = threading.Thread(target=start_discord_bot_background, daemon=True)
+            threading.Thread(target=drain_monitor_handoff, daemon=True).start()
+            discord_bot_thread = threading.Thread(target=start_discord_bot_background,
+                                                  args=(handoff_from_monitor, ),
+                                                  daemon=True)
             discord_bot_thread.start()
-            print("✅ Discord bot started in background")
+            print("✅ Discord bot started in background (direct queue handoff)")
         except Exception as e:
             print(f"⚠️ Discord bot not started: {e}")
     else:
@@ -0,0 +1,475 @@
+import re
+
+from config import (NAME_PATTERNS, MONEY_PATTERNS_LABELS, PLAYERS_PATTERNS,
+                    JOB_ID_PATTERNS, SCRIPT_PATTERNS, JOIN_LINK_PATTERNS,
+                    MONEY_PATTERNS, SOURCE_SIGNATURES)
+from metrics import MESSAGES_ROUTED
+from server_entry import ServerEntry
+
+# Точность и скорость разбора проверяются на записанных сообщениях:
+# python parser_bench.py (образцы в parser_corpus/)
+
+ICE_HUB_MARKER = 'Ice Hub Finder - Target Located'
+ICE_HUB_PLACE_ID = '109983668079237'
+
+_UUID_LINE = re.compile(r'[a-f0-9\-]{36}')
+_UUID_SEARCH = re.compile(r'([a-f0-9\-]{36})')
+_GAME_INSTANCE = re.compile(r'gameInstanceId=([a-f0-9\-]+)')
+_MONEY_PER_SECOND = (re.compile(r'(\d+(?:\.\d+)?)\s*([KMB]?)/s', re.IGNORECASE),
+                     re.compile(r'(\d+(?:\.\d+)?)\s*([KMB]?)', re.IGNORECASE))
+_MONEY = tuple(re.compile(pattern, re.IGNORECASE) for pattern in MONEY_PATTERNS)
+
+# Заголовки формата Brainrot Notify / Chilli Hub: (эмодзи, ключевое слово, поле).
+# Порядок важен: строка с несколькими эмодзи уходит первому подходящему полю
+EMOJI_HEADERS = (
+    ('🏷️', 'Name', 'name'),
+    ('💰', 'Money per sec', 'money'),
+    ('👥', 'Players', 'players'),
+    ('🆔', None, 'job_id'),
+    ('🌐', 'Join Link', 'join_link'),
+    ('📜', 'Join Script', 'script'),
+)
+
+# Заголовки текстового формата без эмодзи, в порядке приоритета
+KEYWORD_HEADERS = (
+    ('Name', 'name'),
+    ('Money', 'money'),
+    ('Players', 'players'),
+    ('Job ID', 'job_id'),
+    ('Join Script', 'script'),
+    ('Join Link', 'join_link'),
+)
+_KEYWORD_TOKEN = re.compile('|'.join(re.escape(keyword) for keyword, _ in KEYWORD_HEADERS))
+# Строка-заголовок для многострочного имени: любое ключевое слово, кроме Name
+_FIELD_HEADER = re.compile('|'.join(re.escape(keyword) for keyword, field in KEYWORD_HEADERS
+                                    if field != 'name'))
+
+
+def _any_of(patterns):
+    return re.compile('|'.join(re.escape(pattern) for pattern in patterns))
+
+
+# Поля embed: подстрока в имени поля -> какие атрибуты оно заполняет
+_EMBED_LABELS = (
+    ('name', _any_of(NAME_PATTERNS)),
+    ('money', _any_of(MONEY_PATTERNS_LABELS)),
+    ('players', _any_of(PLAYERS_PATTERNS)),
+    ('job_id', _any_of(JOB_ID_PATTERNS)),
+    ('script', _any_of(SCRIPT_PATTERNS)),
+    ('join_link', _any_of(JOIN_LINK_PATTERNS)),
+)
+HEADER_CACHE_SIZE = 1024
+_emoji_fields = {}
+_embed_field_kinds = {}
+
+
+def parse_message(message_data):
+    """Разбирает сообщение Discord в ServerEntry парсером, выбранным ROUTER"""
+    return ROUTER.parse(message_data)
+
+
+def message_body(message_data):
+    """(content, embeds) сообщения; для пересланных - из первого snapshot"""
+    content = message_data.get('content', '')
+    embeds = message_data.get('embeds', [])
+
+    if not embeds and 'message_snapshots' in message_data:
+        snapshots = message_data.get('message_snapshots', [])
+        if snapshots:
+            snapshot_message = snapshots[0].get('message', {})
+            embeds = snapshot_message.get('embeds', [])
+            if not content:
+                content = snapshot_message.get('content', '')
+    return content, embeds
+
+
+def parse_generic(content, embeds):
+    """Каскад форматов для сообщений без известной сигнатуры"""
+    if ICE_HUB_MARKER in content:
+        return parse_ice_hub(content, embeds)
+    if has_emoji_headers(content):
+        return parse_emoji_lines(split_lines(content))
+    if not embeds and content:
+        return parse_keyword_lines(split_lines(content))
+    entry = ServerEntry()
+    if embeds:
+        parse_embeds(entry, embeds)
+    return entry
+
+
+def parse_ice_hub(content, embeds):
+    return parse_ice_hub_lines(split_lines(content))
+
+
+def parse_chilli_hub(content, embeds):
+    # Префикс "Brainrot Notify" бывает и у сообщений с ключевыми словами или
+    # embed: их разбирает общий каскад, как до маршрутизации
+    if embeds or not has_emoji_headers(content):
+        return parse_generic(content, embeds)
+    return parse_emoji_lines(split_lines(content))
+
+
+def split_lines(content):
+    return list(filter(None, map(str.strip, content.split('\n'))))
+
+
+def has_emoji_headers(content):
+    if content.isascii():
+        return False
+    for emoji, _, _ in EMOJI_HEADERS:
+        if emoji in content:
+            return True
+    return False
+
+
+def _emoji_field(line):
+    """Поле для строки-заголовка ('' если это не заголовок); строки заголовков
+    повторяются от сообщения к сообщению, поэтому результат запоминается"""
+    field = _emoji_fields.get(line)
+    if field is None:
+        field = ''
+        for emoji, keyword, name in EMOJI_HEADERS:
+            if emoji in line and (keyword is None or keyword in line):
+                field = name
+                break
+        if len(_emoji_fields) >= HEADER_CACHE_SIZE:
+            _emoji_fields.clear()
+        _emoji_fields[line] = field
+    return field
+
+
+def _keyword_field(line):
+    if _KEYWORD_TOKEN.search(line) is None:
+        return None
+    for keyword, field in KEYWORD_HEADERS:
+        if keyword in line:
+            return field
+    return None
+
+
+def _is_uuid(line):
+    return len(line) == 36 and _UUID_LINE.fullmatch(line) is not None
+
+
+def _is_join_script(script):
+    return 'TeleportService' in script or 'game:' in script.lower()
+
+
+def parse_money_per_second(text):
+    """'$1.5M/s' -> (1.5, '1.5M/s'); K делится на 1000, B умножается"""
+    if not text:
+        return None
+    text = text.replace(',', '').replace('$', '').replace('**', '').replace('`', '').strip()
+    for pattern in _MONEY_PER_SECOND:
+        match = pattern.search(text)
+        if match:
+            return _scaled(match), text
+    return None
+
+
+def parse_money(text):
+    """Деньги по MONEY_PATTERNS из config (формат Ice Hub и embed полей)"""
+    text = text.replace(',', '').replace('**', '').replace('`', '').strip()
+    for pattern in _MONEY:
+        match = pattern.search(text)
+        if match:
+            return _scaled(match), text
+    return None
+
+
+def _scaled(match):
+    value = float(match.group(1))
+    multiplier = match.group(2).upper() if match.lastindex and match.lastindex >= 2 else ''
+    if multiplier == 'K':
+        return value / 1000
+    if multiplier == 'B':
+        return value * 1000
+    return value
+
+
+def _set_money(entry, money):
+    entry.money, entry.money_raw = money
+    entry.is_10m_plus = entry.money >= 10.0
+
+
+def parse_emoji_lines(lines):
+    """Формат с эмодзи заголовками (Brainrot Notify | Chilli Hub)"""
+    entry = ServerEntry()
+    count = len(lines)
+    i = 0
+    while i < count:
+        line = lines[i]
+        # Все эмодзи заголовков вне ASCII: строки значений отсекаются без поиска
+        field = None if line.isascii() else _emoji_field(line)
+        if not field:
+            i += 1
+            continue
+
+        if field == 'job_id':
+            # UUID ищется в трёх следующих строках; если его нет, Job ID сбрасывается
+            entry.job_id = None
+            next_index = i + 1
+            for j in range(i + 1, min(i + 4, count)):
+                if _is_uuid(lines[j]):
+                    entry.job_id = lines[j]
+                    next_index = j + 1
+                    break
+            i = next_index
+            continue
+
+        if i + 1 < count:
+            value = lines[i + 1]
+            if field == 'name':
+                entry.name = value
+            elif field == 'money':
+                money = parse_money_per_second(value)
+                if money:
+                    _set_money(entry, money)
+            elif field == 'players':
+                if '/' in value:
+                    entry.players = value
+            elif field == 'join_link':
+                entry.join_link = value
+            elif _is_join_script(value):
+                entry.script = value
+        i += 2
+    return entry
+
+
+def parse_keyword_lines(lines):
+    """Текстовый формат с заголовками Name / Money / Players / Job ID / ..."""
+    entry = ServerEntry()
+    count = len(lines)
+    i = 0
+    while i < count:
+        field = _keyword_field(lines[i])
+        if field is None:
+            i += 1
+            continue
+
+        if field == 'name':
+            i += 1
+            start = i
+            # Имя может занимать несколько строк - до следующего заголовка
+            while i < count and _FIELD_HEADER.search(lines[i]) is None:
+                i += 1
+            if i > start:
+                entry.name = ' '.join(lines[start:i]).strip()
+            continue
+
+        if field == 'job_id':
+            entry.job_id = None
+            i += 1
+            if i < count and _is_uuid(lines[i]):
+                entry.job_id = lines[i]
+                i += 2 if i + 1 < count and _is_uuid(lines[i + 1]) else 1
+            continue
+
+        if field == 'money':
+            money = parse_money_per_second(lines[i + 1] if i + 1 < count else '')
+            if money:
+                _set_money(entry, money)
+            i += 2
+            continue
+
+        if field == 'players':
+            if i + 1 < count and '/' in lines[i + 1]:
+                entry.players = lines[i + 1]
+            i += 2
+            continue
+
+        if i + 1 < count:
+            value = lines[i + 1]
+            if field == 'join_link':
+                entry.join_link = value
+            elif _is_join_script(value):
+                entry.script = value
+            i += 2
+        else:
+            i += 1
+    return entry
+
+
+def parse_ice_hub_lines(lines):
+    """Ice Hub: UUID + 'игроки | доход | имя' или блок 'Server Info'"""
+    entry = ServerEntry(source='ice_hub')
+    count = len(lines)
+    for i, line in enumerate(lines):
+        if line == 'Server Info' and i + 1 < count:
+            _parse_ice_hub_server_info(entry, lines, i + 1)
+            break
+        if i + 1 < count and _is_uuid(line) and '/' in lines[i + 1]:
+            parts = lines[i + 1].split(' | ')
+            if len(parts) < 3:
+                continue
+            entry.job_id = line
+            players = parts[0].strip()
+            if '/' in players:
+                entry.players = players
+            income = parts[1].strip()
+            if income != 'None':
+                money = parse_money(income)
+                if money:
+                    _set_money(entry, money)
+            name = parts[2].strip()
+            if name != 'Unknown':
+                entry.name = name
+
+    if entry.job_id and not entry.script:
+        entry.script = (f"game:GetService('TeleportService'):TeleportToPlaceInstance("
+                        f"{ICE_HUB_PLACE_ID}, '{entry.job_id}')")
+    return entry
+
+
+def _parse_ice_hub_server_info(entry, lines, start):
+    count = len(lines)
+    for i in range(start, count):
+        line = lines[i]
+        if line.startswith('Job ID:') and i + 1 < count:
+            if _is_uuid(lines[i + 1]):
+                entry.job_id = lines[i + 1]
+            return
+        if line.startswith('Players:') and i + 1 < count:
+            players = lines[i + 1]
+            if players.isdigit():
+                entry.players = f"{players}/18"
+        elif line.startswith('Total Income:') and i + 1 < count:
+            income = lines[i + 1]
+            if income != '0/s':
+                money = parse_money(income)
+                if money:
+                    _set_money(entry, money)
+        elif line.startswith('PC Script') and i + 2 < count:
+            if 'TeleportService' in lines[i + 1]:
+                entry.script = lines[i + 1]
+            return
+
+
+def _field_kinds(field_name):
+    kinds = _embed_field_kinds.get(field_name)
+    if kinds is None:
+        kinds = frozenset(kind for kind, pattern in _EMBED_LABELS if pattern.search(field_name))
+        if len(_embed_field_kinds) >= HEADER_CACHE_SIZE:
+            _embed_field_kinds.clear()
+        _embed_field_kinds[field_name] = kinds
+    return kinds
+
+
+def parse_embeds(entry, embeds):
+    """Поля embed; Job ID, если его нет в своём поле, берётся из gameInstanceId
+    ссылки или из первого UUID в любом поле"""
+    fallback_job_id = None
+    for embed in embeds:
+        for field in embed.get('fields', []):
+            value = field['value']
+            kinds = _field_kinds(field['name'])
+            if kinds:
+                if 'name' in kinds:
+                    entry.name = value.strip()
+                if 'money' in kinds:
+                    money = parse_money(value.replace('**', '').replace('`', '').strip())
+                    if money:
+                        entry.money, entry.money_raw = money
+                        if entry.money >= 10.0:
+                            entry.is_10m_plus = True
+                if 'players' in kinds:
+                    entry.players = value.replace('**', '').replace('`', '').strip()
+                if 'job_id' in kinds:
+                    match = _UUID_SEARCH.search(value.replace('```', '').strip())
+                    if match:
+                        entry.job_id = match.group(1)
+                if 'script' in kinds:
+                    entry.script = value.strip()
+                    if not entry.job_id:
+                        match = _UUID_SEARCH.search(value)
+                        if match:
+                            entry.job_id = match.group(1)
+                if 'join_link' in kinds:
+                    entry.join_link = value.strip()
+            if not entry.job_id and fallback_job_id is None:
+                match = _UUID_SEARCH.search(value.replace('```', '').replace('**', '').strip())
+                if match:
+                    fallback_job_id = match.group(1)
+
+    if not entry.job_id and entry.join_link:
+        match = _GAME_INSTANCE.search(entry.join_link)
+        if match:
+            entry.job_id = match.group(1)
+    if not entry.job_id:
+        entry.job_id = fallback_job_id
+
+
+class ParserRouter:
+    """Реестр парсеров источников. Сообщение уходит ровно одному парсеру по
+    дешёвой сигнатуре - ID автора, ID канала или началу текста; если ничего
+    не совпало, разбирается fallback парсером"""
+
+    def __init__(self, fallback, fallback_name='generic'):
+        self.fallback = (fallback_name, fallback)
+        self.by_author = {}
+        self.by_channel = {}
+        self.prefixes = ()
+        self._prefix_tuple = ()
+
+    def register(self, name, parse, author_ids=(), channel_ids=(), prefixes=()):
+        """parse(content, embeds) -> ServerEntry"""
+        route = (name, parse)
+        for author_id in author_ids:
+            self.by_author[str(author_id)] = route
+        for channel_id in channel_ids:
+            self.by_channel[str(channel_id)] = route
+        self.prefixes += tuple((prefix, route) for prefix in prefixes)
+        self._prefix_tuple = tuple(prefix for prefix, _ in self.prefixes)
+
+    def route(self, message_data, content):
+        """-> ((имя, parse), сработавшая сигнатура)"""
+        if self.by_author:
+            author = message_data.get('author') or {}
+            route = self.by_author.get(author.get('id'))
+            if route:
+                return route, 'author'
+        if self.by_channel:
+            route = self.by_channel.get(message_data.get('channel_id'))
+            if route:
+                return route, 'channel'
+        if content and content.startswith(self._prefix_tuple):
+            for prefix, route in self.prefixes:
+                if content.startswith(prefix):
+                    return route, 'prefix'
+        return self.fallback, 'fallback'
+
+    def resolve(self, message_data):
+        """-> (имя парсера, parse, content, embeds); решение учитывается в метриках"""
+        content, embeds = message_body(message_data)
+        (name, parse), signature = self.route(message_data, content)
+        MESSAGES_ROUTED.inc(name, signature)
+        return name, parse, content, embeds
+
+    def parse(self, message_data):
+        _, parse, content, embeds = self.resolve(message_data)
+        return parse(content, embeds)
+
+
+# Парсеры, на которые можно сослаться из SOURCE_SIGNATURES в config
+SOURCE_PARSERS = {
+    'ice_hub': parse_ice_hub,
+    'chilli_hub': parse_chilli_hub,
+    'generic': parse_generic,
+}
+
+
+def build_router(signatures):
+    router = ParserRouter(parse_generic)
+    for name, signature in signatures.items():
+        if name not in SOURCE_PARSERS:
+            raise ValueError(f"Unknown parser '{name}' in SOURCE_SIGNATURES")
+        router.register(name,
+                        SOURCE_PARSERS[name],
+                        author_ids=signature.get('author_ids', ()),
+                        channel_ids=signature.get('channel_ids', ()),
+                        prefixes=signature.get('prefixes', ()))
+    return router
+
+
+ROUTER = build_router(SOURCE_SIGNATURES)
+
@@ -0,0 +1,127 @@
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+class Counter:
+    """Счётчик Prometheus с метками; inc стоит один dict lookup под локом"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма Prometheus: observe - bisect по границам и три сложения"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'), ), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labelnames + ('le', ), labels + (le, ))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_LATENCY = Histogram(
+    'autojoiner_stage_latency_seconds',
+    'Latency between pipeline stages from Discord MESSAGE_CREATE to pull',
+    ('stage', ))
+SERVERS_PARSED = Counter('autojoiner_servers_parsed_total',
+                         'Discord messages parsed into a server record',
+                         ('source', ))
+SERVERS_PUSHED = Counter('autojoiner_servers_pushed_total',
+                         'Server records handed from the Discord monitor to the queue',
+                         ('source', ))
+GATEWAY_FRAMES = Counter('autojoiner_gateway_frames_total',
+                         'Discord gateway frames decoded or skipped by the raw pre-scan',
+                         ('result', ))
+MESSAGES_ROUTED = Counter('autojoiner_messages_routed_total',
+                          'Discord messages by chosen parser and matched signature',
+                          ('parser', 'signature'))
+PARSE_CACHE_LOOKUPS = Counter('autojoiner_parse_cache_lookups_total',
+                              'Parse cache lookups for incoming messages', ('result', ))
+FILTER_REJECTS = Counter('autojoiner_filter_rejects_total',
+                         'Server records rejected by filters', ('reason', ))
+LOG_RECORDS_DROPPED = Counter('autojoiner_log_records_dropped_total',
+                              'Console log records dropped because output fell behind')
+HTTP_PUSH_RESULTS = Counter('autojoiner_http_push_results_total',
+                            'Discord monitor pushes to the HTTP API by outcome',
+                            ('result', ))
+WEBSOCKET_DROPS = Counter('autojoiner_websocket_dropped_total',
+                          'Messages dropped from WebSocket client queues on overflow',
+                          ('policy', ))
+WEBSOCKET_FILTERED = Counter('autojoiner_websocket_filtered_total',
+                             'Broadcast deliveries skipped because of client subscriptions')
+QUEUE_PUSHES = Counter('autojoiner_queue_pushes_total',
+                       'Queue pushes by source and dedup result',
+                       ('source', 'status'))
+QUEUE_REMOVALS = Counter('autojoiner_queue_removals_total',
+                         'Entries leaving the queue by reason', ('reason', ))
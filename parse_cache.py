@@ -0,0 +1,74 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class ParseCache:
+    """LRU кэш результатов разбора и фильтрации с TTL.
+
+    Ключ - blake2b от имени парсера, текста и полей embed, поэтому копии
+    одного уведомления, пересланные в разные каналы (в том числе через
+    message_snapshots), попадают в одну запись. Хранятся только ServerEntry и
+    результат фильтров, а не само сообщение, так что память ограничена
+    max_entries записями размером не больше одного сообщения Discord.
+    """
+
+    def __init__(self, max_entries=512, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(parser_name, content, embeds):
+        # Парсеры не видят пустых строк и пробелов по краям, а в embed читают
+        # только поля: заголовки, цвета и вложения в ключ не входят
+        digest = hashlib.blake2b(parser_name.encode(), digest_size=16)
+        digest.update(b'\x00')
+        digest.update((content or '').strip().encode('utf-8', 'surrogatepass'))
+        for embed in embeds or ():
+            digest.update(b'\x1d')
+            for field in embed.get('fields', ()):
+                digest.update(b'\x1e')
+                digest.update(str(field.get('name')).encode('utf-8', 'surrogatepass'))
+                digest.update(b'\x1f')
+                digest.update(str(field.get('value')).encode('utf-8', 'surrogatepass'))
+        return digest.digest()
+
+    def get(self, key):
+        """-> (ServerEntry, filter_result) или None"""
+        item = self._entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, entry, filter_result = item
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry, filter_result
+
+    def put(self, key, entry, filter_result):
+        self._entries[key] = (time.monotonic() + self.ttl, entry, filter_result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from colorama import Fore, Style
+
+from discord_bot_http import DiscordMonitor
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus')
+CHECKED_FIELDS = ('name', 'money', 'money_raw', 'players', 'job_id', 'script',
+                  'join_link', 'is_10m_plus', 'source', 'passed')
+
+
+def load_corpus(path=CORPUS_DIR):
+    """Файлы *.json вида {"message": <d из MESSAGE_CREATE>, "expected": {...}};
+    необязательный "note" поясняет расхождение с исходным парсером"""
+    corpus = []
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(path, filename), encoding='utf-8') as f:
+            sample = json.load(f)
+        corpus.append((filename[:-5], sample['message'], sample.get('expected', {})))
+    return corpus
+
+
+def quiet_monitor():
+    monitor = DiscordMonitor('http://corpus.invalid')
+    monitor.log = lambda *args, **kwargs: None
+    return monitor
+
+
+async def parse_and_filter(monitor, message):
+    parsed_data = await monitor.parse_message_data(message)
+    filter_result = await monitor.apply_filters(parsed_data)
+    result = parsed_data.to_dict()
+    result['passed'] = filter_result['passed']
+    return result
+
+
+async def check_accuracy(monitor, corpus):
+    """-> ({поле: (совпало, проверено)}, [(sample, поле, ожидалось, получено)])"""
+    fields = {field: [0, 0] for field in CHECKED_FIELDS}
+    mismatches = []
+    for name, message, expected in corpus:
+        result = await parse_and_filter(monitor, message)
+        for field in CHECKED_FIELDS:
+            if field not in expected:
+                continue
+            fields[field][1] += 1
+            if result.get(field) == expected[field]:
+                fields[field][0] += 1
+            else:
+                mismatches.append((name, field, expected[field], result.get(field)))
+    return {field: tuple(counts) for field, counts in fields.items()}, mismatches
+
+
+async def measure_throughput(monitor, corpus, seconds=2.0):
+    processed = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _, message, _ in corpus:
+            await parse_and_filter(monitor, message)
+        processed += len(corpus)
+    return processed / (time.perf_counter() - started)
+
+
+async def measure_allocations(monitor, corpus, rounds=20):
+    """Средний пик выделенной памяти и число блоков, созданных на одно сообщение"""
+    # Первый проход прогревает кэши парсера, чтобы не считать их заполнение
+    for _, message, _ in corpus:
+        await parse_and_filter(monitor, message)
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(rounds):
+            for _, message, _ in corpus:
+                tracemalloc.reset_peak()
+                current, _ = tracemalloc.get_traced_memory()
+                await parse_and_filter(monitor, message)
+                peak_total += tracemalloc.get_traced_memory()[1] - current
+        retained = sys.getallocatedblocks() - blocks_before
+    finally:
+        tracemalloc.stop()
+    messages = rounds * len(corpus)
+    return peak_total / messages, retained / messages
+
+
+async def record_expected(monitor, corpus, path=CORPUS_DIR):
+    """Заполняет expected текущими результатами у новых образцов (без
+    expected); проверенные вручную ожидания не перезаписываются"""
+    for name, message, expected in corpus:
+        if expected:
+            continue
+        result = await parse_and_filter(monitor, message)
+        with open(os.path.join(path, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'message': message, 'expected': result}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+
+async def run(path=CORPUS_DIR, record=False, seconds=2.0):
+    corpus = load_corpus(path)
+    monitor = quiet_monitor()
+    print(f"📂 Corpus: {len(corpus)} messages from {path}")
+
+    if record:
+        await record_expected(monitor, corpus, path)
+        print(f"{Fore.GREEN}💾 Expected fields recorded for new samples, check them by hand{Style.RESET_ALL}")
+        return True
+
+    fields, mismatches = await check_accuracy(monitor, corpus)
+    matched = sum(ok for ok, _ in fields.values())
+    checked = sum(total for _, total in fields.values())
+    print(f"🎯 Field accuracy: {matched}/{checked} ({matched / checked:.1%})" if checked
+          else "🎯 Field accuracy: no expected fields")
+    for field, (ok, total) in fields.items():
+        if total:
+            color = Fore.GREEN if ok == total else Fore.RED
+            print(f"   {color}{field:<12} {ok}/{total}{Style.RESET_ALL}")
+    for name, field, expected, got in mismatches:
+        print(f"   {Fore.YELLOW}⚠️ {name}.{field}: expected {expected!r}, got {got!r}{Style.RESET_ALL}")
+
+    rate = await measure_throughput(monitor, corpus, seconds)
+    peak_bytes, retained_blocks = await measure_allocations(monitor, corpus)
+    print(f"⚡ Throughput: {rate:.0f} msg/s (parse + filters)")
+    print(f"🧠 Allocations: {peak_bytes / 1024:.1f} KiB peak per message, "
+          f"{retained_blocks:.2f} blocks retained per message")
+    return not mismatches
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    ok = asyncio.run(run(args[0] if args else CORPUS_DIR, record='--record' in sys.argv))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from colorama import Fore
+from requests.adapters import HTTPAdapter
+
+from config import (PUSH_MAX_IN_FLIGHT, PUSH_QUEUE_SIZE, PUSH_MAX_RETRIES,
+                    PUSH_RETRY_DELAY, PUSH_TIMEOUT, PUSH_BATCH_MAX, SERVER_TTL)
+from console_log import get_logger
+from metrics import HTTP_PUSH_RESULTS, STAGE_LATENCY
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class PushClient:
+    """Отправка ServerEntry в HTTP API, не блокирующая event loop.
+
+    submit() только ставит запись в очередь. Воркеры отправляют записи через
+    requests.Session с keep-alive пулом в пуле потоков, не больше
+    max_in_flight запросов одновременно; накопившиеся записи уходят одним
+    запросом в /api/server/push_batch. Неудачные отправки повторяются с
+    экспоненциальной задержкой, пока запись не старше SERVER_TTL: после этого
+    она всё равно истекла бы в очереди.
+    """
+
+    def __init__(self,
+                 api_url,
+                 on_sent=None,
+                 max_in_flight=PUSH_MAX_IN_FLIGHT,
+                 queue_size=PUSH_QUEUE_SIZE,
+                 max_retries=PUSH_MAX_RETRIES,
+                 retry_delay=PUSH_RETRY_DELAY,
+                 timeout=PUSH_TIMEOUT):
+        self.api_url = api_url
+        self.on_sent = on_sent
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.console = get_logger('PUSH')
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight,
+                                           thread_name_prefix='push')
+        self.queue = None
+        self.workers = []
+
+    def log(self, message, color=Fore.WHITE, level=logging.INFO):
+        self.console.log(message, color, level)
+
+    def submit(self, entry):
+        """Ставит запись в очередь отправки; False, если очередь переполнена"""
+        if self.queue is None:
+            self.start()
+        try:
+            self.queue.put_nowait((entry, 0))
+            return True
+        except asyncio.QueueFull:
+            HTTP_PUSH_RESULTS.inc('dropped')
+            self.log(f"⚠️ Push queue full, dropped {entry.name}", Fore.YELLOW, logging.WARNING)
+            return False
+
+    def start(self):
+        """Запускает воркеры в текущем event loop"""
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.max_in_flight)]
+
+    def pending(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < PUSH_BATCH_MAX and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            entries = [entry for entry, _ in batch]
+            try:
+                outcomes = await loop.run_in_executor(self.executor, self.send, entries)
+            except Exception as e:
+                outcomes = [('retry', str(e))] * len(batch)
+
+            for (entry, attempt), (outcome, detail) in zip(batch, outcomes):
+                if outcome == 'sent':
+                    HTTP_PUSH_RESULTS.inc('sent')
+                    STAGE_LATENCY.observe(time.monotonic() - entry.created, 'http_push')
+                    if self.on_sent:
+                        self.on_sent(entry)
+                elif outcome == 'retry':
+                    self.schedule_retry(loop, entry, attempt, detail)
+                else:
+                    HTTP_PUSH_RESULTS.inc('rejected')
+                    self.log(f"❌ HTTP API rejected {entry.name}: {detail}", Fore.RED, logging.WARNING)
+
+    def schedule_retry(self, loop, entry, attempt, reason):
+        age = time.monotonic() - entry.created
+        if attempt >= self.max_retries or age >= SERVER_TTL:
+            HTTP_PUSH_RESULTS.inc('dropped')
+            self.log(f"❌ Failed to send {entry.name} to HTTP API after {attempt + 1} attempt(s): {reason}",
+                     Fore.RED, logging.WARNING)
+            return
+        HTTP_PUSH_RESULTS.inc('retried')
+        delay = self.retry_delay * (2**attempt)
+        self.log(f"🔁 Retrying push of {entry.name} in {delay:.1f}s: {reason}", Fore.YELLOW,
+                 logging.DEBUG)
+        loop.call_later(delay, self.requeue, entry, attempt + 1)
+
+    def requeue(self, entry, attempt):
+        try:
+            self.queue.put_nowait((entry, attempt))
+        except asyncio.QueueFull:
+            HTTP_PUSH_RESULTS.inc('dropped')
+
+    def send(self, entries):
+        """Выполняется в пуле потоков -> [(sent|retry|rejected, подробности)]"""
+        if len(entries) == 1:
+            response = self.session.post(f"{self.api_url}/api/server/push",
+                                         json=entries[0].to_dict(),
+                                         timeout=self.timeout)
+            return [self.outcome(response)]
+
+        response = self.session.post(f"{self.api_url}/api/server/push_batch",
+                                     json=[entry.to_dict() for entry in entries],
+                                     timeout=self.timeout)
+        if response.status_code != 200:
+            return [self.outcome(response)] * len(entries)
+        outcomes = []
+        for result in response.json().get('results', []):
+            if result.get('status') == 'error':
+                outcomes.append(('rejected', result.get('error')))
+            else:
+                outcomes.append(('sent', result.get('status')))
+        missing = len(entries) - len(outcomes)
+        return outcomes + [('retry', 'missing batch result')] * missing
+
+    @staticmethod
+    def outcome(response):
+        if response.status_code == 200:
+            return 'sent', response.json().get('status')
+        if response.status_code in RETRYABLE_STATUS:
+            return 'retry', f"HTTP {response.status_code}"
+        return 'rejected', f"HTTP {response.status_code}"
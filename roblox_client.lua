@@ -1,6 +1,21 @@
 local API_URL = "https://d14b0190-6f03-4e17-891a-c03cea8e1d19-00-3cfj2zt8ev9zl.spock.replit.dev"
 local POLL_INTERVAL = 2
+local LONG_POLL_WAIT = 25
 local JOIN_TIMEOUT = 5
+local PULL_MODE = "lease"
+-- WebSocket сервер (websocket_server.py) присылает записи сразу;
+-- если executor не поддерживает WebSocket или соединение рвётся - HTTP опрос
+local USE_WEBSOCKET = true
+-- Тот же хост, что API_URL: nginx проксирует location /ws на порт 8765
+-- (deploy/install.sh), https даёт wss. Без прокси укажите адрес напрямую,
+-- например "ws://127.0.0.1:8765"
+local WEBSOCKET_URL = (string.gsub(string.gsub(API_URL, "/+$", ""), "^http", "ws")) .. "/ws"
+local WIRE_FORMAT = 2
+-- Подписка: сервер присылает только подходящие записи. nil - все записи.
+-- Поля (любые можно опустить): min_money, max_players, allow_names, deny_names.
+-- min_money - в миллионах в секунду, как money записи: 1 = $1M/s, 0.5 = $500K/s
+-- Пример: {min_money = 1, max_players = 7, deny_names = {"Noobini Pizzanini"}}
+local SUBSCRIPTION = nil
 
 local HttpService = game:GetService("HttpService")
 local TeleportService = game:GetService("TeleportService")
@@ -11,6 +26,7 @@ local autoJoinEnabled = true
 local lastJobId = nil
 local isRunning = true
 local playerUsername = Players.LocalPlayer.Name
+local consumerId = tostring(Players.LocalPlayer.UserId)
 
 local gui = nil
 local mainFrame = nil
@@ -70,6 +86,61 @@ local function httpRequest(url, method, body)
     return nil
 end
 
+-- Формат 2 (wire_format.py): "2|", затем поля "<длина в байтах>:<значение>"
+-- в порядке FRAME_FIELDS. Значение берётся одним string.sub по длине, поэтому
+-- '|', '=' и ':' в имени ничего не ломают
+local FRAME_FIELDS = {"job_id", "name", "money", "player_count", "max_players", "is_10m_plus", "source"}
+
+local function decodeServerFrame(frame)
+    local prefix = WIRE_FORMAT .. "|"
+    if string.sub(frame, 1, #prefix) ~= prefix then
+        return nil
+    end
+
+    local fields = {}
+    local pos = #prefix + 1
+    for _, field in ipairs(FRAME_FIELDS) do
+        local digits = string.match(frame, "^(%d+):", pos)
+        if not digits then
+            return nil
+        end
+        local first = pos + #digits + 1
+        local last = first + tonumber(digits) - 1
+        if last > #frame then
+            return nil
+        end
+        fields[field] = string.sub(frame, first, last)
+        pos = last + 1
+    end
+    if pos ~= #frame + 1 then
+        return nil
+    end
+
+    local players = nil
+    if fields.player_count ~= "" and fields.max_players ~= "" then
+        players = fields.player_count .. "/" .. fields.max_players
+    end
+    return {
+        job_id = fields.job_id,
+        name = fields.name ~= "" and fields.name or nil,
+        money = tonumber(fields.money),
+        players = players,
+        is_10m_plus = fields.is_10m_plus == "1",
+        source = fields.source
+    }
+end
+
+-- Кадры, закодированные wire_format.encode_framed
+local function wireFormatSelfTest()
+    local tricky = decodeServerFrame("2|9:1234-abcd23:A|money=999|job_id=evil3:1.51:31:81:17:ice_hub")
+    local unicode = decodeServerFrame("2|4:9f8e18:🔥 La Vacca: 10M4:12.00:0:1:07:discord")
+    return tricky ~= nil and tricky.job_id == "1234-abcd" and tricky.name == "A|money=999|job_id=evil"
+        and tricky.money == 1.5 and tricky.players == "3/8" and tricky.is_10m_plus == true
+        and unicode ~= nil and unicode.name == "🔥 La Vacca: 10M" and unicode.money == 12
+        and unicode.players == nil and unicode.is_10m_plus == false
+        and decodeServerFrame("2|9:1234-abcd23:A|money=999") == nil
+end
+
 local function log(message, color)
     print("[" .. os.date("%H:%M:%S") .. "] " .. message)
     if statusLabel then
@@ -177,24 +248,47 @@ local function updateGUI(serverData)
     end
 end
 
+local function settleLease(serverData, action, blocking)
+    if PULL_MODE ~= "lease" or not serverData.lease_id then
+        return
+    end
+
+    local function send()
+        httpRequest(API_URL .. "/api/server/" .. action, "POST", {
+            consumer_id = consumerId,
+            lease_id = serverData.lease_id
+        })
+    end
+
+    if blocking then
+        send()
+    else
+        task.spawn(send)
+    end
+end
+
 local function joinServer(serverData)
     if not autoJoinEnabled then
         log("Auto-join is disabled", WARNING_COLOR)
+        settleLease(serverData, "nack")
         return
     end
 
     if isJoining then
         log("Already attempting to join...", WARNING_COLOR)
+        settleLease(serverData, "nack")
         return
     end
 
     if not serverData.job_id or serverData.job_id == "" then
         log("No job ID available", ERROR_COLOR)
+        settleLease(serverData, "nack")
         return
     end
 
     if serverData.job_id == lastJobId then
         log("Skipping duplicate server", WARNING_COLOR)
+        settleLease(serverData, "nack")
         return
     end
 
@@ -218,6 +312,11 @@ local function joinServer(serverData)
         end
     end)
 
+    -- Телепорт обычно завершает скрипт, и после него ack уже не уйдёт:
+    -- подтверждаем аренду до телепорта. Если он не удастся, запись
+    -- потеряна только для этого сервера, а не повиснет в аренде
+    settleLease(serverData, "ack", true)
+
     task.spawn(function()
         local success, errorMessage = pcall(function()
             local placeId = 109983668079237
@@ -243,35 +342,95 @@ local function joinServer(serverData)
 end
 
 local function fetchServerData()
-    local data = httpRequest(API_URL .. "/api/server/pull")
+    local data = httpRequest(API_URL .. "/api/server/pull?wait=" .. LONG_POLL_WAIT .. "&consumer_id=" .. consumerId .. "&mode=" .. PULL_MODE)
 
-    if data and data.status == "success" and data.data then
-        return data.data
+    if data and data.status == "success" then
+        return data.data, true
     end
 
-    return nil
+    return nil, false
 end
 
 local function startPolling()
     task.spawn(function()
-        log("Starting HTTP polling...", SUCCESS_COLOR)
+        log("Starting HTTP long-polling...", SUCCESS_COLOR)
         
         while isRunning do
             if autoJoinEnabled and not isJoining then
-                local serverData = fetchServerData()
+                local serverData, ok = fetchServerData()
                 
                 if serverData and serverData.job_id and serverData.job_id ~= "" then
                     log("New server data received!", SUCCESS_COLOR)
                     updateGUI(serverData)
                     joinServer(serverData)
+                elseif not ok then
+                    task.wait(POLL_INTERVAL)
                 end
+            else
+                task.wait(POLL_INTERVAL)
             end
-            
-            task.wait(POLL_INTERVAL)
         end
     end)
 end
 
+local function connectWebSocket()
+    local connect = (WebSocket and WebSocket.connect) or (syn and syn.websocket and syn.websocket.connect)
+    if not connect then
+        log("WebSocket not supported by executor, using HTTP", WARNING_COLOR)
+        return false
+    end
+    if not wireFormatSelfTest() then
+        log("Wire format self-test failed, using HTTP", ERROR_COLOR)
+        return false
+    end
+
+    local ok, socket = pcall(connect, WEBSOCKET_URL)
+    if not ok or not socket then
+        log("WebSocket connect failed, using HTTP: " .. tostring(socket), WARNING_COLOR)
+        return false
+    end
+
+    socket.OnMessage:Connect(function(message)
+        if string.sub(message, 1, 1) == "{" then
+            local parsed, data = pcall(function()
+                return HttpService:JSONDecode(message)
+            end)
+            if parsed and data and data.type == "welcome" then
+                log("WebSocket connected (format v" .. tostring(data.format) .. ")", SUCCESS_COLOR)
+            elseif parsed and data and data.type == "subscribed" then
+                log("WebSocket subscription active", SUCCESS_COLOR)
+            elseif parsed and data and data.type == "error" then
+                log("WebSocket subscription rejected: " .. tostring(data.error), WARNING_COLOR)
+            end
+            return
+        end
+
+        local serverData = decodeServerFrame(message)
+        if serverData and serverData.job_id ~= "" and autoJoinEnabled and not isJoining then
+            log("New server data received!", SUCCESS_COLOR)
+            updateGUI(serverData)
+            joinServer(serverData)
+        end
+    end)
+
+    socket.OnClose:Connect(function()
+        if isRunning then
+            log("WebSocket closed, switching to HTTP polling", WARNING_COLOR)
+            startPolling()
+        end
+    end)
+
+    socket:Send(HttpService:JSONEncode({type = "hello", formats = {WIRE_FORMAT}}))
+    if SUBSCRIPTION then
+        local subscription = {type = "subscribe"}
+        for key, value in pairs(SUBSCRIPTION) do
+            subscription[key] = value
+        end
+        socket:Send(HttpService:JSONEncode(subscription))
+    end
+    return true
+end
+
 function createMainGUI()
     gui = Instance.new("ScreenGui")
     gui.Name = "RobloxAutoJoiner"
@@ -494,4 +653,6 @@ print("[" .. os.date("%H:%M:%S") .. "] Player: " .. playerUsername)
 
 createMainGUI()
 task.wait(0.5)
-startPolling()
+if not (USE_WEBSOCKET and connectWebSocket()) then
+    startPolling()
+end
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from colorama import Fore
+
+import config
+from config import RUNTIME_CONFIG_FILE, RUNTIME_CONFIG_POLL
+from console_log import get_logger
+
+
+def _bool(name, value):
+    if not isinstance(value, bool):
+        raise ValueError(f"{name} must be true or false")
+    return value
+
+
+def _number(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    return value
+
+
+def _count(name, value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} must be a non-negative integer")
+    return value
+
+
+def _names(name, value):
+    if not isinstance(value, (list, tuple, set, frozenset)) or not all(
+            isinstance(item, str) for item in value):
+        raise ValueError(f"{name} must be a list of strings")
+    return frozenset(value)
+
+
+def _channels(name, value):
+    # В JSON id канала может прийти числом; Discord присылает его строкой
+    if not isinstance(value, (list, tuple, set, frozenset)) or not all(
+            isinstance(item, (str, int)) and not isinstance(item, bool) for item in value):
+        raise ValueError(f"{name} must be a list of channel ids")
+    channels = frozenset(str(item) for item in value)
+    if not all(channel.isdigit() for channel in channels):
+        raise ValueError(f"{name} must contain numeric channel ids")
+    return channels
+
+
+def _fields(schema, check=None):
+    """Валидатор dict-настройки: неуказанные поля берутся из текущего значения"""
+
+    def validate(name, value, current):
+        if not isinstance(value, dict):
+            raise ValueError(f"{name} must be an object")
+        unknown = set(value) - set(schema)
+        if unknown:
+            raise ValueError(f"{name} has unknown field(s): {', '.join(sorted(unknown))}")
+        merged = dict(current or {})
+        for field, field_value in value.items():
+            merged[field] = schema[field](f"{name}.{field}", field_value)
+        missing = set(schema) - set(merged)
+        if missing:
+            raise ValueError(f"{name} is missing field(s): {', '.join(sorted(missing))}")
+        if check:
+            check(name, merged)
+        return MappingProxyType(merged)
+
+    return validate
+
+
+def _ordered(low, high):
+
+    def check(name, value):
+        if value[low] > value[high]:
+            raise ValueError(f"{name}.{low} must not be greater than {name}.{high}")
+
+    return check
+
+
+# Настройки config.py, которые можно менять без перезапуска
+VALIDATORS = {
+    'MONITORED_CHANNELS': lambda name, value, current: _channels(name, value),
+    'ICE_HUB_FILTER': _fields({
+        'enabled': _bool,
+        'require_job_id': _bool,
+        'min_players': _count,
+        'max_players': _count,
+        'ignore_zero_income': _bool
+    }, _ordered('min_players', 'max_players')),
+    'MONEY_THRESHOLD': _fields({
+        'min': _number,
+        'max': _number
+    }, _ordered('min', 'max')),
+    'PLAYER_THRESHOLD': lambda name, value, current: _count(name, value),
+    'IGNORE_UNKNOWN': lambda name, value, current: _bool(name, value),
+    'IGNORE_LIST': lambda name, value, current: _names(name, value),
+    'FILTER_BY_NAME': _fields({
+        'enabled': _bool,
+        'allowed_names': _names
+    }),
+    'BYPASS_10M': lambda name, value, current: _bool(name, value),
+}
+
+
+def to_json(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
+
+
+class RuntimeConfig:
+    """Настройки из VALIDATORS, которые меняются без перезапуска.
+
+    current - неизменяемый снимок (MappingProxyType, множества - frozenset).
+    Новый снимок целиком собирается и проверяется заранее, а затем
+    подменяется одним присваиванием, так что читатели видят либо старые, либо
+    новые настройки целиком. Источники изменений: JSON файл path
+    (переопределения поверх config.py, опрашивается по mtime) и update() из
+    /api/config, который сохраняет результат в тот же файл - так его
+    подхватывают и другие процессы, следящие за файлом.
+    """
+
+    def __init__(self, path=RUNTIME_CONFIG_FILE, poll_interval=RUNTIME_CONFIG_POLL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.console = get_logger('CONFIG')
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.defaults = self.validate({name: getattr(config, name) for name in VALIDATORS}, {})
+        self.current = self.defaults
+        self.version = 0
+        self.stamp = None
+        self.watcher = None
+        self.reload()
+
+    def log(self, message, color=Fore.WHITE, level=logging.INFO):
+        self.console.log(message, color, level)
+
+    @staticmethod
+    def validate(changes, base):
+        """-> новый снимок: base с применёнными changes; ValueError при ошибке"""
+        if not isinstance(changes, dict):
+            raise ValueError("Config must be a JSON object")
+        unknown = set(changes) - set(VALIDATORS)
+        if unknown:
+            raise ValueError(f"Unknown or non-reloadable setting(s): {', '.join(sorted(unknown))}")
+        settings = dict(base)
+        for name, value in changes.items():
+            settings[name] = VALIDATORS[name](name, value, base.get(name))
+        return MappingProxyType(settings)
+
+    def subscribe(self, callback):
+        """callback(settings) вызывается после каждой подмены снимка"""
+        self.listeners.append(callback)
+
+    def swap(self, settings, origin):
+        changed = sorted(name for name in settings if settings[name] != self.current[name])
+        if not changed:
+            return False
+        self.current = settings
+        self.version += 1
+        for callback in self.listeners:
+            try:
+                callback(settings)
+            except Exception as e:
+                self.log(f"❌ Config listener failed: {e}", Fore.RED, logging.ERROR)
+        self.log(f"🔧 Runtime config v{self.version} from {origin}: {', '.join(changed)}", Fore.CYAN)
+        return True
+
+    def update(self, changes):
+        """Проверяет изменения, сохраняет их в файл и применяет -> снимок"""
+        with self.lock:
+            settings = self.validate(changes, self.current)
+            self.write(settings)
+            self.swap(settings, 'API')
+            return settings
+
+    def write(self, settings):
+        overrides = {name: to_json(value) for name, value in settings.items()
+                     if value != self.defaults[name]}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(overrides, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        os.replace(temp_path, self.path)
+        self.stamp = self.file_stamp()
+
+    def file_stamp(self):
+        # Размер вместе с mtime: на грубых часах ФС дописанный файл может
+        # получить то же время, что и прочитанный наполовину
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        """Перечитывает файл, если он изменился; ошибка оставляет прежний снимок"""
+        stamp = self.file_stamp()
+        if stamp == self.stamp:
+            return False
+
+        with self.lock:
+            self.stamp = stamp
+            try:
+                overrides = {}
+                if stamp is not None:
+                    with open(self.path, encoding='utf-8') as f:
+                        overrides = json.load(f)
+                settings = self.validate(overrides, self.defaults)
+            except (OSError, ValueError) as e:
+                self.log(f"⚠️ Ignoring invalid {self.path}: {e}", Fore.YELLOW, logging.WARNING)
+                return False
+            return self.swap(settings, self.path)
+
+    def start_watching(self):
+        if self.watcher is None:
+            self.watcher = threading.Thread(target=self.watch, name='runtime-config', daemon=True)
+            self.watcher.start()
+
+    def watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                self.log(f"❌ Config reload failed: {e}", Fore.RED, logging.ERROR)
+
+    def to_dict(self):
+        return {'version': self.version, 'path': self.path, 'settings': to_json(self.current)}
+
+
+RUNTIME_CONFIG = RuntimeConfig()
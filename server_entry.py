@@ -0,0 +1,135 @@
+import re
+import time
+
+# "5/8", "5 / 8 players": хвост после пары чисел отбрасывается
+_PLAYER_PAIR = re.compile(r'\s*(\d+)\s*/\s*(\d+)')
+
+
+def _is_empty(value):
+    return value is None or value == '' or value is False
+
+
+class ServerEntry:
+    """Запись о сервере, общая для Discord бота, HTTP API и WebSocket сервера.
+
+    created - time.monotonic() момента появления записи. Количество игроков
+    хранится уже разобранным в player_count/max_players; строка "5/8" нужна
+    только на границе с JSON.
+    """
+
+    __slots__ = ('name', 'money', 'money_raw', 'player_count', 'max_players',
+                 'job_id', 'script', 'join_link', 'is_10m_plus', 'source',
+                 'created', 'queue_id')
+
+    def __init__(self,
+                 name=None,
+                 money=None,
+                 money_raw=None,
+                 player_count=None,
+                 max_players=None,
+                 job_id=None,
+                 script=None,
+                 join_link=None,
+                 is_10m_plus=False,
+                 source='discord',
+                 created=None):
+        self.name = name
+        self.money = money
+        self.money_raw = money_raw
+        self.player_count = player_count
+        self.max_players = max_players
+        self.job_id = job_id
+        self.script = script
+        self.join_link = join_link
+        self.is_10m_plus = is_10m_plus
+        self.source = source
+        self.created = time.monotonic() if created is None else created
+        self.queue_id = None
+
+    @property
+    def players(self):
+        if self.player_count is None:
+            return None
+        if self.max_players is None:
+            return str(self.player_count)
+        return f"{self.player_count}/{self.max_players}"
+
+    @players.setter
+    def players(self, text):
+        self.player_count, self.max_players = parse_players(text)
+
+    def merge(self, other):
+        """Дополняет запись полями дубликата: пустые поля заполняются,
+        деньги берутся наибольшие, created остаётся самым ранним"""
+        for field in ('name', 'money_raw', 'job_id', 'script', 'join_link'):
+            if _is_empty(getattr(self, field)) and not _is_empty(getattr(other, field)):
+                setattr(self, field, getattr(other, field))
+        if self.player_count is None and other.player_count is not None:
+            self.player_count = other.player_count
+            self.max_players = other.max_players
+        if other.money is not None and (self.money is None or other.money > self.money):
+            self.money = other.money
+            self.money_raw = other.money_raw or self.money_raw
+        self.is_10m_plus = bool(self.is_10m_plus or other.is_10m_plus)
+        self.created = min(self.created, other.created)
+
+    def copy(self):
+        """Копия записи без queue_id"""
+        entry = ServerEntry.__new__(ServerEntry)
+        for field in self.__slots__:
+            setattr(entry, field, getattr(self, field))
+        entry.queue_id = None
+        return entry
+
+    def to_dict(self):
+        data = {
+            'name': self.name,
+            'money': self.money,
+            'money_raw': self.money_raw,
+            'players': self.players,
+            'job_id': self.job_id,
+            'script': self.script,
+            'join_link': self.join_link,
+            'is_10m_plus': self.is_10m_plus,
+            'source': self.source
+        }
+        if self.queue_id is not None:
+            data['id'] = self.queue_id
+        return data
+
+    @classmethod
+    def from_dict(cls, data, created=None):
+        entry = cls(name=data.get('name'),
+                    money=data.get('money'),
+                    money_raw=data.get('money_raw'),
+                    job_id=data.get('job_id'),
+                    script=data.get('script'),
+                    join_link=data.get('join_link'),
+                    is_10m_plus=bool(data.get('is_10m_plus', False)),
+                    source=data.get('source') or 'discord',
+                    created=created)
+        entry.players = data.get('players')
+        return entry
+
+    def __repr__(self):
+        return (f"ServerEntry(name={self.name!r}, money={self.money!r}, "
+                f"players={self.players!r}, job_id={self.job_id!r})")
+
+
+def parse_players(text):
+    """'5/8' -> (5, 8); всё, что не разбирается, -> (None, None)"""
+    if not text:
+        return None, None
+    pair = _PLAYER_PAIR.match(str(text))
+    if pair:
+        return int(pair.group(1)), int(pair.group(2))
+    current, _, maximum = str(text).partition('/')
+    try:
+        player_count = int(current.strip())
+    except ValueError:
+        return None, None
+    try:
+        max_players = int(maximum.strip()) if maximum else None
+    except ValueError:
+        max_players = None
+    return player_count, max_players
@@ -0,0 +1,517 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from server_entry import ServerEntry
+
+SCHEMA_VERSION = 6
+
+# Как часто ожидающий pull перепроверяет базу на записи из других воркеров
+CROSS_WORKER_RECHECK = 0.25
+
+# Сколько последних событий очереди хранится для SSE подписчиков
+EVENT_LOG_SIZE = 1000
+
+
+class ServerQueueStore:
+    """Очередь серверов в SQLite (WAL), общая для всех воркеров gunicorn"""
+
+    def __init__(self, path, max_size=100, ttl=10, dedup_ttl=60, lease_ttl=3):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.dedup_ttl = dedup_ttl
+        self.lease_ttl = lease_ttl
+        # timing_hook(event, seconds): 'handout' при выдаче записи потребителю
+        # и причина удаления (pulled, acked, expired, evicted) - со временем
+        # с момента постановки в очередь. Используется для метрик.
+        self.timing_hook = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path,
+                                     timeout=5,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._transaction() as cur:
+            version = cur.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # Записи живут секунды, поэтому старую схему просто пересоздаём
+                cur.execute('DROP TABLE IF EXISTS servers')
+                cur.execute('DROP TABLE IF EXISTS events')
+                cur.execute('DROP TABLE IF EXISTS job_index')
+                cur.execute('DROP TABLE IF EXISTS counters')
+                cur.execute('DROP TABLE IF EXISTS deliveries')
+                cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            # deadline хранится в time.monotonic(): на Linux это CLOCK_MONOTONIC,
+            # общий для всех процессов хоста и не зависящий от перевода часов
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS servers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    is_10m_plus INTEGER NOT NULL,
+                    money REAL NOT NULL,
+                    deadline REAL NOT NULL,
+                    enqueued REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_until REAL,
+                    payload TEXT NOT NULL
+                )
+            ''')
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS servers_priority
+                ON servers (is_10m_plus DESC, money DESC, id)
+            ''')
+            cur.execute(
+                'CREATE INDEX IF NOT EXISTS servers_deadline ON servers (deadline)')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            ''')
+            # job_id помнится dedup_ttl секунд, даже после выдачи записи клиенту;
+            # запись, вытесненная или истёкшая невыданной, забывается сразу
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS job_index (
+                    job_id TEXT PRIMARY KEY,
+                    server_id INTEGER NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            cur.execute(
+                'CREATE INDEX IF NOT EXISTS job_index_expires ON job_index (expires)')
+            # Кому из потребителей запись уже выдавалась (лизинг и broadcast)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    server_id INTEGER NOT NULL,
+                    consumer_id TEXT NOT NULL,
+                    PRIMARY KEY (server_id, consumer_id)
+                )
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def push(self, entry):
+        """Добавляет сервер в очередь; дубликат по job_id сливается с уже
+        известной записью. Возвращает status (added, merged или duplicate),
+        id записи и размер очереди."""
+        with self._changed:
+            with self._transaction() as cur:
+                self._expire(cur)
+                result = self._push(cur, entry)
+                result['queue_size'] = self._size(cur)
+            self._changed.notify_all()
+        return result
+
+    def push_many(self, items):
+        """Пакетная вставка за один захват блокировки и одну транзакцию.
+        items - список (ServerEntry или None); для None в ответе тоже None."""
+        with self._changed:
+            with self._transaction() as cur:
+                self._expire(cur)
+                results = [
+                    self._push(cur, entry) if entry is not None else None
+                    for entry in items
+                ]
+                queue_size = self._size(cur)
+            self._changed.notify_all()
+        return results, queue_size
+
+    def _push(self, cur, entry):
+        now = time.monotonic()
+        if entry.job_id:
+            known = cur.execute(
+                'SELECT server_id FROM job_index WHERE job_id = ? AND expires > ?',
+                (entry.job_id, now)).fetchone()
+            self._increment(cur, 'dedup_hits' if known else 'dedup_misses')
+            if known:
+                return self._merge(cur, known[0], entry)
+
+        deadline = entry.created + self.ttl
+        cur.execute(
+            'INSERT INTO servers (is_10m_plus, money, deadline, enqueued, payload) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (1 if entry.is_10m_plus else 0, _money_key(entry.money), deadline,
+             now, json.dumps(entry.to_dict(), ensure_ascii=False)))
+        entry.queue_id = cur.lastrowid
+        if entry.job_id:
+            cur.execute(
+                'INSERT OR REPLACE INTO job_index (job_id, server_id, expires) '
+                'VALUES (?, ?, ?)', (entry.job_id, entry.queue_id, now + self.dedup_ttl))
+        self._emit(cur, 'add', {
+            'id': entry.queue_id,
+            'deadline': deadline,
+            'server': entry.to_dict()
+        })
+
+        size = self._size(cur)
+        if size > self.max_size:
+            evicted = cur.execute(
+                'SELECT id FROM servers '
+                'ORDER BY is_10m_plus, money, id DESC LIMIT ?',
+                (size - self.max_size, )).fetchall()
+            self._remove(cur, [row[0] for row in evicted], 'evicted')
+        return {'status': 'added', 'id': entry.queue_id}
+
+    def _merge(self, cur, server_id, entry):
+        row = cur.execute('SELECT id, deadline, payload FROM servers WHERE id = ?',
+                          (server_id, )).fetchone()
+        if row is None:
+            # Запись уже выдана клиенту или истекла: повтор только мешает
+            return {'status': 'duplicate', 'id': server_id}
+
+        merged = self._load(row)
+        merged.merge(entry)
+        deadline = merged.created + self.ttl
+        cur.execute(
+            'UPDATE servers SET is_10m_plus = ?, money = ?, deadline = ?, '
+            'payload = ? WHERE id = ?',
+            (1 if merged.is_10m_plus else 0, _money_key(merged.money), deadline,
+             json.dumps(merged.to_dict(), ensure_ascii=False), server_id))
+        self._emit(cur, 'update', {
+            'id': server_id,
+            'deadline': deadline,
+            'server': merged.to_dict()
+        })
+        return {'status': 'merged', 'id': server_id}
+
+    def _load(self, row):
+        server_id, deadline, payload = row[:3]
+        entry = ServerEntry.from_dict(json.loads(payload),
+                                      created=deadline - self.ttl)
+        entry.queue_id = server_id
+        return entry
+
+    def dedup_stats(self):
+        with self._lock:
+            rows = dict(self._conn.execute(
+                "SELECT name, value FROM counters "
+                "WHERE name IN ('dedup_hits', 'dedup_misses')").fetchall())
+        return {
+            'hits': rows.get('dedup_hits', 0),
+            'misses': rows.get('dedup_misses', 0)
+        }
+
+    @staticmethod
+    def _increment(cur, name, amount=1):
+        cur.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+            (name, amount))
+
+    def pull(self, wait=0, consumer_id=None, mode='lease'):
+        """Выдаёт лучший живой сервер (10M+ первыми, затем по деньгам);
+        при wait > 0 ждёт его появления до wait секунд.
+
+        Без consumer_id запись сразу удаляется из очереди. С consumer_id в
+        режиме 'lease' запись уходит в аренду на lease_ttl секунд до ack/nack,
+        в режиме 'broadcast' каждый потребитель получает каждую запись по
+        одному разу. Возвращает (ServerEntry или None, размер очереди).
+        """
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                version = self._data_version()
+                with self._transaction() as cur:
+                    self._expire(cur)
+                    row = self._select_for(cur, consumer_id, mode)
+                    if row is not None:
+                        entry = self._hand_out(cur, row, consumer_id, mode)
+                        result = entry, self._size(cur)
+                    else:
+                        wake_at = self._next_lease_expiry(cur, deadline)
+                        size = self._size(cur)
+                if row is not None:
+                    self._changed.notify_all()
+                    return result
+
+                if time.monotonic() >= deadline:
+                    return None, size
+                self._wait_for_change(wake_at, version)
+
+    def _select_for(self, cur, consumer_id, mode):
+        now = time.monotonic()
+        order = ' ORDER BY is_10m_plus DESC, money DESC, id LIMIT 1'
+        if consumer_id is None:
+            return cur.execute(
+                'SELECT id, deadline, payload, enqueued FROM servers '
+                'WHERE lease_until IS NULL OR lease_until <= ?' + order,
+                (now, )).fetchone()
+        not_delivered = (
+            'NOT EXISTS (SELECT 1 FROM deliveries '
+            'WHERE server_id = servers.id AND consumer_id = ?)')
+        if mode == 'broadcast':
+            return cur.execute(
+                'SELECT id, deadline, payload, enqueued FROM servers WHERE ' +
+                not_delivered + order,
+                (consumer_id, )).fetchone()
+        return cur.execute(
+            'SELECT id, deadline, payload, enqueued FROM servers '
+            'WHERE (lease_until IS NULL OR lease_until <= ?) AND ' +
+            not_delivered + order, (now, consumer_id)).fetchone()
+
+    def _hand_out(self, cur, row, consumer_id, mode):
+        entry = self._load(row)
+        if self.timing_hook is not None:
+            self.timing_hook('handout', time.monotonic() - row[3])
+        if consumer_id is None:
+            self._remove(cur, [entry.queue_id], 'pulled')
+            return entry
+
+        cur.execute(
+            'INSERT OR IGNORE INTO deliveries (server_id, consumer_id) '
+            'VALUES (?, ?)', (entry.queue_id, consumer_id))
+        if mode != 'broadcast':
+            cur.execute(
+                'UPDATE servers SET lease_owner = ?, lease_until = ? WHERE id = ?',
+                (consumer_id, time.monotonic() + self.lease_duration(entry), entry.queue_id))
+        return entry
+
+    def lease_duration(self, entry):
+        """Срок аренды записи, секунды: не дольше половины оставшейся жизни,
+        чтобы запись пропавшего потребителя ещё успела уйти другому"""
+        remaining = entry.created + self.ttl - time.monotonic()
+        return max(0.0, min(self.lease_ttl, remaining / 2))
+
+    @staticmethod
+    def _next_lease_expiry(cur, deadline):
+        # Истёкшая аренда освобождает запись без записи в базу, поэтому
+        # ожидающий pull должен проснуться к этому моменту сам
+        row = cur.execute(
+            'SELECT MIN(lease_until) FROM servers WHERE lease_until > ?',
+            (time.monotonic(), )).fetchone()
+        if row[0] is None:
+            return deadline
+        return min(deadline, row[0])
+
+    def ack(self, lease_id, consumer_id):
+        """Подтверждает успешный заход: запись удаляется из очереди"""
+        return self._settle(lease_id, consumer_id, acked=True)
+
+    def nack(self, lease_id, consumer_id):
+        """Возвращает запись в очередь для остальных потребителей"""
+        return self._settle(lease_id, consumer_id, acked=False)
+
+    def _settle(self, lease_id, consumer_id, acked):
+        with self._changed:
+            with self._transaction() as cur:
+                row = cur.execute(
+                    'SELECT 1 FROM servers WHERE id = ? AND lease_owner = ? '
+                    'AND lease_until > ?',
+                    (lease_id, consumer_id, time.monotonic())).fetchone()
+                if row is None:
+                    return False
+                if acked:
+                    self._remove(cur, [lease_id], 'acked')
+                else:
+                    cur.execute(
+                        'UPDATE servers SET lease_owner = NULL, lease_until = NULL '
+                        'WHERE id = ?', (lease_id, ))
+            self._changed.notify_all()
+        return True
+
+    def read_events(self, after_id, wait=0, recheck=CROSS_WORKER_RECHECK):
+        """Возвращает события очереди с id > after_id, при wait > 0 ждёт первое из них;
+        recheck - как часто смотреть изменения из других процессов"""
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                version = self._data_version()
+                rows = self._conn.execute(
+                    'SELECT id, kind, payload FROM events WHERE id > ? ORDER BY id',
+                    (after_id, )).fetchall()
+                if rows or not self._wait_for_change(deadline, version, recheck):
+                    return [(row[0], row[1], json.loads(row[2]))
+                            for row in rows]
+
+    def last_event_id(self):
+        with self._lock:
+            row = self._conn.execute('SELECT MAX(id) FROM events').fetchone()
+        return row[0] or 0
+
+    def _wait_for_change(self, deadline, version, recheck=CROSS_WORKER_RECHECK):
+        # Вызывается под self._changed. Изменение из этого процесса будит сразу
+        # через notify_all, изменение из другого воркера замечаем по
+        # PRAGMA data_version. Возвращает False, если время вышло.
+        remaining = deadline - time.monotonic()
+        while remaining > 0:
+            if self._changed.wait(min(remaining, recheck)):
+                return True
+            if self._data_version() != version:
+                return True
+            remaining = deadline - time.monotonic()
+        return False
+
+    def _data_version(self):
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def snapshot(self):
+        """Живые записи в порядке выдачи с id, возрастом и оставшимся временем жизни"""
+        with self._lock:
+            now = time.monotonic()
+            rows = self._conn.execute(
+                'SELECT id, deadline, payload FROM servers WHERE deadline > ? '
+                'ORDER BY is_10m_plus DESC, money DESC, id', (now, )).fetchall()
+        queue_list = []
+        for server_id, deadline, payload in rows:
+            server = json.loads(payload)
+            server['id'] = server_id
+            server['age_seconds'] = self.ttl - (deadline - now)
+            server['time_remaining'] = deadline - now
+            queue_list.append(server)
+        return queue_list
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM servers WHERE deadline > ?',
+                (time.monotonic(), )).fetchone()[0]
+
+    def expire_when_due(self, max_wait):
+        """Спит до ближайшего дедлайна (или до изменения очереди) и удаляет
+        просроченные записи ровно в срок. Возвращает число удалённых."""
+        with self._changed:
+            version = self._data_version()
+            row = self._conn.execute('SELECT MIN(deadline) FROM servers').fetchone()
+            wake_at = time.monotonic() + max_wait
+            if row[0] is not None:
+                wake_at = min(wake_at, row[0])
+            self._wait_for_change(wake_at, version)
+            with self._transaction() as cur:
+                expired = self._expire(cur)
+            if expired:
+                self._changed.notify_all()
+        return expired
+
+    def __len__(self):
+        return self.size()
+
+    def _expire(self, cur):
+        now = time.monotonic()
+        cur.execute('DELETE FROM job_index WHERE expires <= ?', (now, ))
+        expired = cur.execute('SELECT id FROM servers WHERE deadline <= ?',
+                              (now, )).fetchall()
+        self._remove(cur, [row[0] for row in expired], 'expired')
+        return len(expired)
+
+    def _remove(self, cur, server_ids, reason):
+        for server_id in server_ids:
+            if self.timing_hook is not None:
+                enqueued = cur.execute(
+                    'SELECT enqueued FROM servers WHERE id = ?',
+                    (server_id, )).fetchone()
+                if enqueued is not None:
+                    self.timing_hook(reason, time.monotonic() - enqueued[0])
+            cur.execute('DELETE FROM servers WHERE id = ?', (server_id, ))
+            cur.execute('DELETE FROM deliveries WHERE server_id = ?',
+                        (server_id, ))
+            if reason in ('evicted', 'expired'):
+                # Сервер никто не получил: повторная публикация должна пройти
+                cur.execute('DELETE FROM job_index WHERE server_id = ?',
+                            (server_id, ))
+            self._emit(cur, 'remove', {'id': server_id, 'reason': reason})
+
+    @staticmethod
+    def _emit(cur, kind, data):
+        cur.execute('INSERT INTO events (kind, payload) VALUES (?, ?)',
+                    (kind, json.dumps(data, ensure_ascii=False)))
+        cur.execute('DELETE FROM events WHERE id <= ?',
+                    (cur.lastrowid - EVENT_LOG_SIZE, ))
+
+    @staticmethod
+    def _size(cur):
+        return cur.execute('SELECT COUNT(*) FROM servers').fetchone()[0]
+
+
+def _money_key(money):
+    try:
+        return float(money)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, чтобы воркеры не читали очередь наполовину"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cur = None
+
+    def __enter__(self):
+        self._cur = self._conn.cursor()
+        self._cur.execute('BEGIN IMMEDIATE')
+        return self._cur
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._cur.execute('COMMIT')
+        else:
+            self._cur.execute('ROLLBACK')
+        self._cur.close()
+        return False
+
+
+class EventFeed:
+    """События очереди для всех SSE потоков процесса.
+
+    Базу читает один поток follow() (одна проверка PRAGMA data_version раз в
+    CROSS_WORKER_RECHECK на процесс, а не на каждую открытую вкладку); потоки
+    SSE ждут на своём Condition и в SQLite не ходят. Поток ответа на каждую
+    вкладку при этом остаётся: его держит сам WSGI сервер.
+    """
+
+    def __init__(self, store, size=EVENT_LOG_SIZE):
+        self.store = store
+        self.events = deque(maxlen=size)
+        self.last_id = store.last_event_id()
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._changed:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.follow, name='event-feed',
+                                                daemon=True)
+                self._thread.start()
+
+    def follow(self):
+        while True:
+            try:
+                events = self.store.read_events(self.last_id, wait=60)
+            except Exception:
+                time.sleep(1)
+                continue
+            if events:
+                with self._changed:
+                    self.events.extend(events)
+                    self.last_id = events[-1][0]
+                    self._changed.notify_all()
+
+    def read(self, after_id, wait=0):
+        """Как ServerQueueStore.read_events, но из памяти; отставший
+        читатель, чьих событий уже нет в буфере, дочитывает их из базы"""
+        self.start()
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while self.last_id <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._changed.wait(remaining)
+            if self.events and self.events[0][0] <= after_id + 1:
+                return [event for event in self.events if event[0] > after_id]
+        return self.store.read_events(after_id)
@@ -0,0 +1,113 @@
+import math
+from bisect import bisect_left, bisect_right
+
+
+def _number(data, key):
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} must be a number")
+    return value
+
+
+def _names(data, key):
+    value = data.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{key} must be a list of strings")
+    return frozenset(item.casefold() for item in value)
+
+
+class Subscription:
+    """Что клиент хочет получать: money >= min_money, player_count <=
+    max_players, имя в allow_names и не в deny_names (без учёта регистра).
+    min_money - в единицах money записи, миллионах в секунду ($1M/s = 1,
+    $500K/s = 0.5). Неизвестные значения записи (None) проходят проверки
+    игроков, но не проходят порог денег и список разрешённых имён"""
+
+    __slots__ = ('min_money', 'max_players', 'allow_names', 'deny_names')
+
+    def __init__(self, min_money=None, max_players=None, allow_names=None, deny_names=None):
+        self.min_money = -math.inf if min_money is None else min_money
+        self.max_players = max_players
+        self.allow_names = allow_names
+        self.deny_names = deny_names or frozenset()
+
+    @classmethod
+    def from_message(cls, data):
+        """{"type": "subscribe", "min_money", "max_players", "allow_names", "deny_names"};
+        ValueError при неверных полях"""
+        return cls(_number(data, 'min_money'), _number(data, 'max_players'),
+                   _names(data, 'allow_names'), _names(data, 'deny_names'))
+
+    def matches(self, entry):
+        """Проверки кроме min_money: порог денег уже учтён индексом"""
+        if self.max_players is not None and entry.player_count is not None \
+                and entry.player_count > self.max_players:
+            return False
+        if self.allow_names is None and not self.deny_names:
+            return True
+        name = entry.name.casefold() if entry.name else None
+        if self.allow_names is not None and name not in self.allow_names:
+            return False
+        return name not in self.deny_names
+
+    @property
+    def is_filtering(self):
+        return (self.max_players is not None or self.allow_names is not None
+                or bool(self.deny_names))
+
+    def to_dict(self):
+        return {
+            'min_money': None if self.min_money == -math.inf else self.min_money,
+            'max_players': self.max_players,
+            'allow_names': sorted(self.allow_names) if self.allow_names is not None else None,
+            'deny_names': sorted(self.deny_names)
+        }
+
+
+class SubscriptionIndex:
+    """Клиенты, упорядоченные по min_money подписки.
+
+    Для записи с money подходят только клиенты из префикса с порогом <= money
+    (bisect), остальные даже не просматриваются; оставшиеся условия
+    проверяются лишь у тех, у кого они заданы. Изменяется и читается из
+    event loop WebSocket сервера.
+    """
+
+    def __init__(self):
+        self.thresholds = []
+        self.channels = []
+
+    def add(self, channel):
+        position = bisect_right(self.thresholds, channel.subscription.min_money)
+        self.thresholds.insert(position, channel.subscription.min_money)
+        self.channels.insert(position, channel)
+
+    def remove(self, channel):
+        threshold = channel.subscription.min_money
+        position = bisect_left(self.thresholds, threshold)
+        while position < len(self.channels) and self.thresholds[position] == threshold:
+            if self.channels[position] is channel:
+                del self.thresholds[position]
+                del self.channels[position]
+                return True
+            position += 1
+        return False
+
+    def update(self, channel, subscription):
+        self.remove(channel)
+        channel.subscription = subscription
+        self.add(channel)
+
+    def match(self, entry):
+        """-> список клиентов, которым нужна запись"""
+        money = -math.inf if entry.money is None else entry.money
+        candidates = self.channels[:bisect_right(self.thresholds, money)]
+        return [channel for channel in candidates
+                if not channel.subscription.is_filtering or channel.subscription.matches(entry)]
+
+    def __len__(self):
+        return len(self.channels)
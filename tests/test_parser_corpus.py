@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from parser_bench import CHECKED_FIELDS, load_corpus, parse_and_filter, quiet_monitor
+
+CORPUS = load_corpus()
+
+
+@pytest.fixture(scope='module')
+def monitor():
+    return quiet_monitor()
+
+
+def test_corpus_is_not_empty():
+    assert CORPUS
+
+
+@pytest.mark.parametrize('name, message, expected', CORPUS, ids=[name for name, _, _ in CORPUS])
+def test_corpus_sample(monitor, name, message, expected):
+    result = asyncio.run(parse_and_filter(monitor, message))
+    mismatches = {field: (expected[field], result.get(field))
+                  for field in CHECKED_FIELDS
+                  if field in expected and result.get(field) != expected[field]}
+    assert not mismatches, f"{name}: field -> (expected, got): {mismatches}"
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from server_entry import ServerEntry
+from server_store import ServerQueueStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ServerQueueStore(str(tmp_path / 'queue.db'), ttl=2, lease_ttl=2)
+
+
+def test_lease_is_capped_by_entry_lifetime(store):
+    store.push(ServerEntry(name='A', money=1.0, job_id='job-1'))
+    entry, _ = store.pull(consumer_id='a')
+    assert entry is not None
+    assert store.lease_duration(entry) <= store.ttl / 2
+
+
+def test_expired_lease_goes_to_next_consumer(store):
+    store.push(ServerEntry(name='A', money=1.0, job_id='job-1'))
+    leased, _ = store.pull(consumer_id='a')
+    assert leased is not None
+
+    # Потребитель 'a' пропал без ack/nack: после аренды запись достаётся 'b',
+    # хотя срок жизни записи равен сроку аренды
+    entry, _ = store.pull(wait=store.ttl, consumer_id='b')
+    assert entry is not None
+    assert entry.job_id == 'job-1'
+    assert time.monotonic() < entry.created + store.ttl
+
+
+def test_acked_lease_is_not_handed_out_again(store):
+    store.push(ServerEntry(name='A', money=1.0, job_id='job-1'))
+    leased, _ = store.pull(consumer_id='a')
+    assert store.ack(leased.queue_id, 'a')
+
+    entry, size = store.pull(consumer_id='b')
+    assert entry is None
+    assert size == 0
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from server_entry import ServerEntry
+from wire_format import (FORMAT_FRAMED, FORMAT_LEGACY, FRAMED_FIELDS, decode_framed,
+                         encode_framed, negotiate)
+
+
+def expected_fields(entry):
+    values = {}
+    for name in FRAMED_FIELDS:
+        value = getattr(entry, name)
+        if value is None:
+            value = ''
+        elif isinstance(value, bool):
+            value = '1' if value else '0'
+        elif isinstance(value, float):
+            value = repr(value)
+        values[name] = str(value)
+    return values
+
+
+@pytest.mark.parametrize('entry', [
+    ServerEntry(),
+    ServerEntry(name='A|money=999|job_id=evil', money=1.5, player_count=3, max_players=8,
+                job_id='1234-abcd', is_10m_plus=True, source='ice_hub'),
+    ServerEntry(name='key:value=1|2:3', job_id='12:34', source='a|b=c'),
+    ServerEntry(name='🔥 Brainrot: La Vacca Ñжé', money=12345678.9, player_count=0, max_players=0),
+    ServerEntry(name='', money=0.0, job_id='', source=''),
+], ids=['empty', 'separators', 'colons', 'multibyte', 'empty-strings'])
+def test_round_trip(entry):
+    assert decode_framed(encode_framed(entry)) == expected_fields(entry)
+
+
+def test_round_trip_random():
+    rng = random.Random(0)
+    alphabet = 'abcXYZ 019|=:;\\"\'{}\n\t$💰🔥Ñжé'
+
+    def text():
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+
+    for _ in range(1000):
+        entry = ServerEntry(name=rng.choice([None, text()]),
+                            money=rng.choice([None, 0.0, rng.random() * 10**rng.randint(0, 9)]),
+                            player_count=rng.choice([None, rng.randint(0, 50)]),
+                            max_players=rng.choice([None, rng.randint(0, 50)]),
+                            job_id=rng.choice([None, '', text()]),
+                            is_10m_plus=rng.random() < 0.5,
+                            source=text())
+        assert decode_framed(encode_framed(entry)) == expected_fields(entry)
+
+
+def test_lengths_are_utf8_bytes():
+    frame = encode_framed(ServerEntry(name='жé🔥'))
+    assert '8:жé🔥' in frame
+
+
+def test_script_is_not_sent():
+    frame = encode_framed(ServerEntry(job_id='abc', script='game:GetService("TeleportService")'))
+    assert 'TeleportService' not in frame
+
+
+def test_truncated_frame_is_rejected():
+    frame = encode_framed(ServerEntry(name='Los Tralaleritos', money=12.5, job_id='abc-def'))
+    for end in range(len(frame)):
+        assert decode_framed(frame[:end]) is None
+
+
+def test_over_long_frame_is_rejected():
+    frame = encode_framed(ServerEntry(name='Los Tralaleritos', money=12.5, job_id='abc-def'))
+    assert decode_framed(frame + 'x') is None
+    assert decode_framed(frame + '0:') is None
+
+
+@pytest.mark.parametrize('frame', [
+    '',
+    '1|name=a',
+    '3|1:a',
+    '2|x:a',
+    '2|99:short',
+])
+def test_malformed_frame_is_rejected(frame):
+    assert decode_framed(frame) is None
+
+
+@pytest.mark.parametrize('offered, expected', [
+    ([1, 2], FORMAT_FRAMED),
+    ([2], FORMAT_FRAMED),
+    ([1], FORMAT_LEGACY),
+    ([9], FORMAT_LEGACY),
+    ([], FORMAT_LEGACY),
+    (None, FORMAT_LEGACY),
+    ('2', FORMAT_LEGACY),
+])
+def test_negotiate(offered, expected):
+    assert negotiate(offered) == expected
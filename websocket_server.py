@@ -2,34 +2,131 @@ import asyncio
 import websockets
 import json
 import logging
-from datetime import datetime
-from colorama import Fore, Back, Style, init
+import threading
+import time
+from collections import deque
+from colorama import Fore, init
 from typing import Optional
 
-from config import WEBSOCKET_HOST, WEBSOCKET_PORT, WEBSOCKET_RECONNECT_DELAY
+from config import (WEBSOCKET_HOST, WEBSOCKET_PORT, WEBSOCKET_CLIENT_QUEUE_SIZE,
+                    WEBSOCKET_OVERFLOW_POLICY, WEBSOCKET_QUEUE_RECHECK,
+                    QUEUE_DB_PATH, QUEUE_MAX_SIZE, SERVER_TTL, DEDUP_TTL, LEASE_TTL)
+from console_log import get_logger
+from metrics import STAGE_LATENCY, WEBSOCKET_DROPS, WEBSOCKET_FILTERED, render_metrics
+from server_entry import ServerEntry
+from subscriptions import Subscription, SubscriptionIndex
+from wire_format import ENCODERS, FORMAT_LEGACY, negotiate
 
 init(autoreset=True)
 
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'disconnect')
+
+
+class ClientChannel:
+    """Исходящая очередь одного клиента. Рассылка только кладёт сообщение в
+    очередь, в сокет его пишет отдельная задача write(), так что медленный
+    клиент задерживает лишь себя"""
+
+    def __init__(self, websocket, max_size=WEBSOCKET_CLIENT_QUEUE_SIZE,
+                 policy=WEBSOCKET_OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.address = websocket.remote_address
+        self.max_size = max_size
+        self.policy = policy
+        # (данные, время постановки, время публикации записи)
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        # Формат рассылки записей, выбранный по hello клиента (wire_format)
+        self.format = FORMAT_LEGACY
+        # Пока клиент не прислал subscribe, он получает все записи
+        self.subscription = Subscription()
+        self.writer = None
+        self.closing = None
+
+    def offer(self, data, published=None):
+        """-> False, если очередь полна и политика disconnect"""
+        if len(self.queue) >= self.max_size:
+            if self.policy == 'disconnect':
+                return False
+            self.dropped += 1
+            WEBSOCKET_DROPS.inc(self.policy)
+            if self.policy == 'drop_newest':
+                return True
+            self.queue.popleft()
+        self.queue.append((data, time.monotonic(), published))
+        self.ready.set()
+        return True
+
+    async def write(self):
+        try:
+            while True:
+                if not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                data, _, published = self.queue.popleft()
+                await self.websocket.send(data)
+                self.sent += 1
+                if published is not None:
+                    STAGE_LATENCY.observe(time.monotonic() - published, 'queue_to_websocket')
+        except websockets.exceptions.ConnectionClosed:
+            # Клиента уберёт handle_client, когда завершится чтение
+            pass
+
+    def start(self):
+        self.writer = asyncio.create_task(self.write())
+
+    def disconnect(self, code=1013, reason='Client too slow'):
+        self.writer.cancel()
+        self.closing = asyncio.create_task(self.websocket.close(code, reason))
+
+    def lag(self):
+        """Возраст самого старого неотправленного сообщения, секунды"""
+        return time.monotonic() - self.queue[0][1] if self.queue else 0.0
+
+    def stats(self):
+        return {
+            'address': f"{self.address[0]}:{self.address[1]}" if self.address else None,
+            'queued': len(self.queue),
+            'lag': round(self.lag(), 4),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'format': self.format,
+            'subscription': self.subscription.to_dict()
+        }
+
+
 class RobloxWebSocketServer:
-    def __init__(self):
-        self.clients = set()
+    def __init__(self, queue_size=WEBSOCKET_CLIENT_QUEUE_SIZE, overflow_policy=WEBSOCKET_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown WebSocket overflow policy '{overflow_policy}'")
+        # websocket -> ClientChannel
+        self.clients = {}
+        # Те же клиенты, упорядоченные по порогу денег подписки
+        self.subscriptions = SubscriptionIndex()
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
         self.server = None
         self.loop: Optional[asyncio.AbstractEventLoop] = None
 
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
+        self.console = get_logger('WEBSOCKET')
 
-    def log(self, message, color=Fore.WHITE):
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        print(f"[{timestamp}] [WEBSOCKET] {color}{message}{Style.RESET_ALL}")
+    def log(self, message, color=Fore.WHITE, level=logging.INFO):
+        self.console.log(message, color, level)
 
     async def start(self):
+        self.loop = asyncio.get_running_loop()
         self.log(f"🚀 Starting WebSocket server on ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}", Fore.GREEN)
 
         self.server = await websockets.serve(
             self.handle_client,
             WEBSOCKET_HOST,
-            WEBSOCKET_PORT
+            WEBSOCKET_PORT,
+            process_request=self.process_request
         )
 
         self.log("✅ WebSocket server started successfully", Fore.GREEN)
@@ -46,9 +143,27 @@ class RobloxWebSocketServer:
             await self.server.wait_closed()
             self.log("🔌 WebSocket server stopped", Fore.RED)
 
+    def process_request(self, path, request_headers):
+        """Обычные HTTP GET /metrics и /clients на порту WebSocket сервера.
+        Отдельным сервисом (deploy/install.sh) его счётчики и клиенты живут
+        только в этом процессе: HTTP API берёт их отсюда, Prometheus
+        опрашивает /metrics здесь. nginx наружу пробрасывает лишь /ws"""
+        if path == '/metrics':
+            return 200, [('Content-Type', 'text/plain; version=0.0.4')], render_metrics().encode()
+        if path == '/clients':
+            body = json.dumps({
+                'overflow_policy': self.overflow_policy,
+                'clients': self.get_clients_stats()
+            })
+            return 200, [('Content-Type', 'application/json')], body.encode()
+        return None
+
     async def handle_client(self, websocket):
         client_address = websocket.remote_address
-        self.clients.add(websocket)
+        channel = ClientChannel(websocket, self.queue_size, self.overflow_policy)
+        channel.start()
+        self.clients[websocket] = channel
+        self.subscriptions.add(channel)
 
         self.log(f"🔗 New Roblox client connected: {client_address}", Fore.GREEN)
 
@@ -60,7 +175,9 @@ class RobloxWebSocketServer:
         except Exception as e:
             self.log(f"❌ Error handling client {client_address}: {e}", Fore.RED)
         finally:
-            self.clients.discard(websocket)
+            channel.writer.cancel()
+            if self.clients.pop(websocket, None) is not None:
+                self.subscriptions.remove(channel)
 
     async def handle_client_message(self, websocket, message):
         try:
@@ -70,6 +187,27 @@ class RobloxWebSocketServer:
                 status = data.get('status', 'unknown')
                 self.log(f"📱 Roblox client status: {status}", Fore.BLUE)
 
+            elif data.get('type') == 'hello':
+                channel = self.clients.get(websocket)
+                if channel is not None:
+                    channel.format = negotiate(data.get('formats'))
+                    # Через очередь клиента: welcome не обгонит уже поставленные записи
+                    channel.offer(json.dumps({'type': 'welcome', 'format': channel.format}))
+                    self.log(f"🤝 Client {channel.address} uses wire format v{channel.format}", Fore.BLUE)
+
+            elif data.get('type') == 'subscribe':
+                channel = self.clients.get(websocket)
+                if channel is not None:
+                    try:
+                        subscription = Subscription.from_message(data)
+                    except ValueError as e:
+                        channel.offer(json.dumps({'type': 'error', 'error': str(e)}))
+                        self.log(f"⚠️ Invalid subscription from {channel.address}: {e}", Fore.YELLOW)
+                    else:
+                        self.subscriptions.update(channel, subscription)
+                        channel.offer(json.dumps({'type': 'subscribed', **subscription.to_dict()}))
+                        self.log(f"📋 Client {channel.address} subscribed: {subscription.to_dict()}", Fore.BLUE)
+
             elif data.get('type') == 'log':
                 log_message = data.get('message', '')
                 self.log(f"📱 Roblox: {log_message}", Fore.CYAN)
@@ -77,28 +215,74 @@ class RobloxWebSocketServer:
         except json.JSONDecodeError:
             self.log("❌ Invalid JSON received from Roblox client", Fore.RED)
 
-    async def send_to_clients(self, data):
+    def send_to_clients(self, frames, published=None, channels=None):
+        """Кладёт frames[формат клиента] в очередь каждого из channels (по
+        умолчанию всех клиентов), не дожидаясь сокетов -> число получателей"""
         if not self.clients:
-            self.log("⚠️ No Roblox clients connected", Fore.YELLOW)
-            return
+            self.log("⚠️ No Roblox clients connected", Fore.YELLOW, logging.DEBUG)
+            return 0
+
+        delivered = 0
+        for channel in list(self.clients.values()) if channels is None else channels:
+            if channel.offer(frames[channel.format], published):
+                delivered += 1
+                continue
+            del self.clients[channel.websocket]
+            self.subscriptions.remove(channel)
+            channel.disconnect()
+            self.log(f"🔌 Disconnecting slow client {channel.address}: "
+                     f"{len(channel.queue)} messages queued", Fore.YELLOW)
+        return delivered
 
-        clients_to_send = list(self.clients)
+    def broadcast_server_info(self, entry, published=None):
+        # Только клиенты, чья подписка принимает запись: остальные не
+        # просматриваются (индекс по порогу денег) и ничего не получают
+        channels = self.subscriptions.match(entry)
+        skipped = len(self.clients) - len(channels)
+        if skipped:
+            WEBSOCKET_FILTERED.inc(amount=skipped)
+        if not channels:
+            return 0
+        # Кодируем один раз на формат, а не на клиента
+        formats = {channel.format for channel in channels}
+        frames = {version: ENCODERS[version](entry) for version in formats}
+
+        return self.send_to_clients(frames, published, channels)
+
+    def publish(self, entry):
+        """Потокобезопасная рассылка принятой записи: ставит её в loop сервера
+        и не ждёт отправки. Вызывается из потоков HTTP API и очереди монитора"""
+        loop = self.loop
+        if loop is None or not self.clients:
+            return False
+        try:
+            loop.call_soon_threadsafe(self.broadcast_server_info, entry, time.monotonic())
+        except RuntimeError:
+            # loop уже закрыт
+            return False
+        return True
 
-        for client in clients_to_send:
+    def follow_queue(self, store, recheck=WEBSOCKET_QUEUE_RECHECK):
+        """Публикует записи, добавленные в общую SQLite очередь другими
+        процессами (воркеры gunicorn при запуске отдельным сервисом). Блокирует:
+        запускается в своём потоке"""
+        last_event_id = store.last_event_id()
+        self.log(f"📡 Following queue events in {store.path}", Fore.GREEN)
+        while True:
             try:
-                await client.send(data)
-                self.log(f"📤 Data sent to {client.remote_address}", Fore.GREEN)
-            except websockets.exceptions.ConnectionClosed:
-                self.clients.discard(client)
-                self.log(f"🔌 Removing disconnected client: {client.remote_address}", Fore.YELLOW)
+                events = store.read_events(last_event_id, wait=60, recheck=recheck)
             except Exception as e:
-                self.clients.discard(client)
-                self.log(f"❌ Error sending to client {client.remote_address}: {e}", Fore.RED)
+                self.log(f"❌ Queue follower error: {e}", Fore.RED, logging.ERROR)
+                time.sleep(1)
+                continue
+            for event_id, kind, data in events:
+                last_event_id = event_id
+                if kind == 'add':
+                    self.publish(ServerEntry.from_dict(data['server']))
 
-    async def broadcast_server_info(self, server_data):
-        formatted_data = f"name={server_data.get('name', '')}|money={server_data.get('money', 0)}|players={server_data.get('players', '')}|job_id={server_data.get('job_id', '')}|script={server_data.get('script', '')}|is_10m_plus={server_data.get('is_10m_plus', False)}"
-
-        await self.send_to_clients(formatted_data)
+    def get_clients_stats(self):
+        """Очередь, отставание и счётчики по каждому клиенту; можно звать из других потоков"""
+        return [channel.stats() for channel in list(self.clients.values())]
 
     def get_connected_clients_count(self):
         return len(self.clients)
@@ -107,8 +291,21 @@ class RobloxWebSocketServer:
         self.log(f"🔄 Client reconnection requested: {client_address}", Fore.YELLOW)
         self.log("✅ Client reconnection handled", Fore.GREEN)
 
-def start_websocket_server():
-    server = RobloxWebSocketServer()
+def start_websocket_server(server=None):
+    server = server or RobloxWebSocketServer()
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     loop.run_until_complete(server.start())
+
+
+if __name__ == '__main__':
+    # Отдельный сервис (deploy/install.sh): записи приходят в HTTP API других
+    # процессов, поэтому берём их из общей очереди
+    from server_store import ServerQueueStore
+
+    server = RobloxWebSocketServer()
+    store = ServerQueueStore(QUEUE_DB_PATH, max_size=QUEUE_MAX_SIZE, ttl=SERVER_TTL,
+                             dedup_ttl=DEDUP_TTL, lease_ttl=LEASE_TTL)
+    threading.Thread(target=server.follow_queue, args=(store, ), name='queue-follower',
+                     daemon=True).start()
+    start_websocket_server(server)
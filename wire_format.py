@@ -0,0 +1,70 @@
+# 1 - исходная строка name=..|money=..; 2 - поля с префиксом длины.
+# Клиент, не приславший hello, получает формат 1
+FORMAT_LEGACY = 1
+FORMAT_FRAMED = 2
+SUPPORTED_FORMATS = (FORMAT_FRAMED, FORMAT_LEGACY)
+
+# Порядок полей формата 2. script не передаётся: клиенту для входа хватает job_id
+FRAMED_FIELDS = ('job_id', 'name', 'money', 'player_count', 'max_players', 'is_10m_plus', 'source')
+
+
+def negotiate(offered):
+    """Старший формат из предложенных клиентом, который знает сервер"""
+    if isinstance(offered, (list, tuple)):
+        for version in SUPPORTED_FORMATS:
+            if version in offered:
+                return version
+    return FORMAT_LEGACY
+
+
+def encode_legacy(entry):
+    return f"name={entry.name or ''}|money={entry.money or 0}|players={entry.players or ''}|job_id={entry.job_id or ''}|script={entry.script or ''}|is_10m_plus={entry.is_10m_plus}"
+
+
+def _field(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def encode_framed(entry):
+    """"2|" и затем для каждого поля FRAMED_FIELDS "<длина в байтах UTF-8>:<значение>".
+
+    Значения не экранируются: декодер читает длину и берёт ровно столько
+    байт, поэтому '|', '=' и ':' в имени ничего не ломают, а поле достаётся
+    одним срезом без поиска разделителей внутри значений.
+    """
+    parts = [f"{FORMAT_FRAMED}|"]
+    for name in FRAMED_FIELDS:
+        value = _field(getattr(entry, name))
+        parts.append(f"{len(value.encode('utf-8'))}:{value}")
+    return ''.join(parts)
+
+
+def decode_framed(frame):
+    """Эталонный декодер формата 2 (тот же алгоритм, что в roblox_client.lua) ->
+    dict полей-строк или None для чужой версии и повреждённого кадра"""
+    data = frame.encode('utf-8')
+    prefix = f"{FORMAT_FRAMED}|".encode()
+    if not data.startswith(prefix):
+        return None
+    pos = len(prefix)
+    fields = {}
+    for name in FRAMED_FIELDS:
+        colon = data.find(b':', pos)
+        if colon < 0 or not data[pos:colon].isdigit():
+            return None
+        end = colon + 1 + int(data[pos:colon])
+        if end > len(data):
+            return None
+        fields[name] = data[colon + 1:end].decode('utf-8')
+        pos = end
+    return fields if pos == len(data) else None
+
+
+ENCODERS = {FORMAT_LEGACY: encode_legacy, FORMAT_FRAMED: encode_framed}
+